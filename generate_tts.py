@@ -11,11 +11,27 @@ import subprocess
 import re
 import time
 import uuid
+import struct
+import shutil
+import hashlib
+import hmac
+import secrets
+import queue
+import threading
+import functools
+import contextlib
+import urllib.request
+import urllib.error
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from xml.sax.saxutils import escape
 
 
 
 # ============ 多音字处理函数 ============
+_phoneme_file_cache = {}
+
+
 def load_phoneme_dict(input_file, phoneme_file=None):
     """Load phoneme dictionary from JSON file
 
@@ -32,10 +48,17 @@ def load_phoneme_dict(input_file, phoneme_file=None):
 
     for path in search_paths:
         if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                print(f"✓ 加载多音字词典: {path} ({len(data)} 条)")
-                return data
+            # Cached by mtime so --watch and the worker don't re-parse an unchanged file
+            mtime = os.path.getmtime(path)
+            cached = _phoneme_file_cache.get(path)
+            if cached and cached[0] == mtime:
+                data = cached[1]
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                _phoneme_file_cache[path] = (mtime, data)
+            print(f"✓ 加载多音字词典: {path} ({len(data)} 条)")
+            return data
     return {}
 
 
@@ -56,6 +79,7 @@ def extract_inline_phonemes(text):
     return clean, phonemes
 
 
+@functools.lru_cache(maxsize=None)
 def pinyin_to_sapi(pinyin):
     """Convert pinyin with tone marks to SAPI format with numeric tones
 
@@ -149,131 +173,143 @@ BUILTIN_POLYPHONES = {
 }
 
 
+MAX_CHARS = 400
 
-parser = argparse.ArgumentParser(
-    description='Generate TTS audio from podcast script',
-    epilog='Backends: azure (default), cosyvoice, edge (free). Env: TTS_BACKEND, AZURE_SPEECH_KEY, DASHSCOPE_API_KEY, EDGE_TTS_VOICE, TTS_RATE'
-)
-parser.add_argument('--input', '-i', default='podcast.txt', help='Input script file (default: podcast.txt)')
-parser.add_argument('--output-dir', '-o', default='.', help='Output directory for podcast_audio.wav, podcast_audio.srt, timing.json (default: current dir)')
-parser.add_argument('--phonemes', '-p', default=None, help='Phoneme dictionary JSON file (default: phonemes.json in input dir)')
-parser.add_argument('--backend', '-b', default=None,
-    help='TTS backend: azure, cosyvoice, or edge (default: env TTS_BACKEND or azure)')
-parser.add_argument('--resume', action='store_true',
-    help='Resume from last breakpoint, skip already synthesized parts')
-parser.add_argument('--dry-run', action='store_true',
-    help='Parse sections and estimate duration without calling TTS API')
-
-args = parser.parse_args()
+# Per-request payload budget, kept equivalent to the original MAX_CHARS text limit
+# but charged on what each backend actually receives (see payload_cost):
+#   azure     = full SSML document; the constant <speak>/<voice>/<prosody> envelope
+#               is allowed on top, <phoneme>/<lang> tags count against the budget
+#   cosyvoice = text chars
+#   edge      = text chars (edge-tts wraps them in its own SSML and splits at 4096 bytes,
+#               which 400 chars never reach)
+CHUNK_LIMITS = {
+    "azure": MAX_CHARS,
+    "cosyvoice": MAX_CHARS,
+    "edge": MAX_CHARS,
+}
+SECTION_PATTERN = r'\[SECTION:(\w+)\]'
+READ_AS_PATTERN = r'([A-Za-z0-9\-]+)，读作["""]([\u4e00-\u9fff]+)["""]'
+
+# Per-chunk audio cache (content-addressed FLAC, survives edits of other chunks)
+# Watch-mode chunking: an oversize section is cut before the unit whose first
+# ANCHOR_PREFIX chars hash lowest among the cuts filling a chunk to >= ANCHOR_MIN_FILL
+ANCHOR_PREFIX = 4
+ANCHOR_MIN_FILL = 0.45
+
+CACHE_DIR = ".tts_cache"
+# Chunk order of the last run (part files in playback order); kept by every cache policy
+CACHE_MANIFEST = "manifest.json"
+# What stays in the cache after a successful run:
+# used = chunks of the current output (for --resume/--watch), all = everything, none = nothing
+CACHE_POLICIES = ("used", "all", "none")
+OUTPUT_FILES = ("podcast_audio.wav", "podcast_audio.srt", "timing.json")
+
+# Hedged requests: duplicate a chunk request once it runs past the p95 latency
+HEDGE_MIN_SAMPLES = 5
+HEDGE_MIN_DELAY = 2.0  # seconds; never hedge sooner than this
+LATENCY_HISTORY = 200  # per-backend latency samples kept across runs
+
+AZURE_VOICE = "zh-CN-XiaoxiaoMultilingualNeural"
+DEFAULT_COSYVOICE_MODEL = "cosyvoice-v3-flash"
+DEFAULT_COSYVOICE_VOICE = "longxiaochun_v3"
+DEFAULT_EDGE_VOICE = "zh-CN-XiaoxiaoNeural"
 
-BACKEND = args.backend or os.environ.get("TTS_BACKEND", "azure")
-print(f"TTS backend: {BACKEND}")
 
 def check_import(module, pkg, install_cmd):
     try:
         __import__(module)
     except ImportError:
-        print(f"Error: '{pkg}' not installed. Run: {install_cmd}", file=sys.stderr)
-        sys.exit(1)
-
-if BACKEND == "azure":
-    check_import("azure.cognitiveservices.speech", "azure-cognitiveservices-speech",
-                  "pip install azure-cognitiveservices-speech")
-    key = os.environ.get("AZURE_SPEECH_KEY")
-    region = os.environ.get("AZURE_SPEECH_REGION", "eastasia")
-    if not key:
-        print("Error: AZURE_SPEECH_KEY not set", file=sys.stderr)
-        sys.exit(1)
-elif BACKEND == "cosyvoice":
-    check_import("dashscope", "dashscope", "pip install dashscope")
-    if not os.environ.get("DASHSCOPE_API_KEY"):
-        print("Error: DASHSCOPE_API_KEY not set", file=sys.stderr)
+        return f"'{pkg}' not installed. Run: {install_cmd}"
+    return None
+
+
+def backend_error(backend):
+    """Return why the backend can't be used (missing SDK or credentials), or None"""
+    if backend == "azure":
+        error = check_import("azure.cognitiveservices.speech", "azure-cognitiveservices-speech",
+                             "pip install azure-cognitiveservices-speech")
+        if not error and not os.environ.get("AZURE_SPEECH_KEY"):
+            error = "AZURE_SPEECH_KEY not set"
+        return error
+    elif backend == "cosyvoice":
+        error = check_import("dashscope", "dashscope", "pip install dashscope")
+        if not error and not os.environ.get("DASHSCOPE_API_KEY"):
+            error = "DASHSCOPE_API_KEY not set"
+        return error
+    elif backend == "edge":
+        return check_import("edge_tts", "edge-tts", "pip install edge-tts")
+    return f"Unknown backend '{backend}'. Use 'azure', 'cosyvoice', or 'edge'"
+
+
+def check_backend(backend):
+    """Verify SDK and credentials for the selected backend, exit on error"""
+    error = backend_error(backend)
+    if error:
+        print(f"Error: {error}", file=sys.stderr)
         sys.exit(1)
-elif BACKEND == "edge":
-    check_import("edge_tts", "edge-tts", "pip install edge-tts")
-else:
-    print(f"Error: Unknown backend '{BACKEND}'. Use 'azure', 'cosyvoice', or 'edge'", file=sys.stderr)
-    sys.exit(1)
-MAX_CHARS = 400
-
-# Speech rate: -50% ~ +200%, or x-slow/slow/medium/fast/x-fast
-SPEECH_RATE = os.environ.get("TTS_RATE", "+5%")
 
-# Ensure output directory exists
-os.makedirs(args.output_dir, exist_ok=True)
-
-if not os.path.exists(args.input):
-    print(f"Error: Input file not found: {args.input}", file=sys.stderr)
-    sys.exit(1)
-
-with open(args.input, "r") as f:
-    text = f.read().strip()
 
 # ============ 解析章节标记 ============
-# 提取每个章节的名称和开头文本用于精确匹配
-section_pattern = r'\[SECTION:(\w+)\]'
-sections = []
-matches = list(re.finditer(section_pattern, text))
-
-for i, match in enumerate(matches):
-    section_name = match.group(1)
-    start_pos = match.end()
-    end_pos = matches[i+1].start() if i+1 < len(matches) else len(text)
-    section_text = text[start_pos:end_pos].strip()
-    # 提取章节开头的前50个字符用于匹配
-    first_text = re.sub(r'\s+', '', section_text[:80])  # 去除空白便于匹配
-    # 标记无旁白章节（空内容或仅空白）
-    is_silent = len(section_text.strip()) == 0
-    # Extract label: first line of section text (before first punctuation), capped at 10 chars
-    label_text = section_text.split('\n')[0].strip() if section_text.strip() else section_name
-    label = re.split(r'[，。！？、：；]', label_text)[0][:10] if label_text else section_name
-    sections.append({
-        'name': section_name,
-        'label': label or section_name,
-        'first_text': first_text,
-        'start_time': None,
-        'end_time': None,
-        'is_silent': is_silent
-    })
+def parse_script(text):
+    """Parse [SECTION:name] markers and clean the script text
 
-clean_text = re.sub(section_pattern, '', text).strip()
-
-# Extract inline phoneme markers: 执行器[zhí xíng qì]
-clean_text, inline_phonemes = extract_inline_phonemes(clean_text)
-if inline_phonemes:
-    print(f"✓ 提取内联多音字标注: {len(inline_phonemes)} 条")
-    for word, pinyin in inline_phonemes.items():
-        print(f"    {word} → {pinyin}")
-
-# Load phoneme dictionary (file-based)
-file_phonemes = load_phoneme_dict(args.input, args.phonemes)
-
-# Merge: inline > file > builtin (priority order)
-phoneme_dict = {**BUILTIN_POLYPHONES, **file_phonemes, **inline_phonemes}
-print(f"✓ 多音字词典: {len(phoneme_dict)} 条 (内置{len(BUILTIN_POLYPHONES)} + 文件{len(file_phonemes)} + 内联{len(inline_phonemes)})")
-
-
-if not sections:
-    sections = [{'name': 'main', 'first_text': '', 'start_time': 0, 'end_time': None}]
-    print("提示: 未检测到章节标记 [SECTION:name]，将生成单一章节")
-else:
-    print(f"检测到 {len(sections)} 个章节: {[s['name'] for s in sections]}")
-    for s in sections:
-        status = " (silent)" if s.get('is_silent') else ""
-        print(f"  {s['name']}: \"{s['first_text'][:20]}...\"{status}")
-
-# 处理读音替换
-clean_text = re.sub(r'([A-Za-z0-9\-]+)，读作["""]([\u4e00-\u9fff]+)["""]', r"\2", clean_text)
-print(f"文本长度: {len(clean_text)} 字符")
-
-# Dry-run: estimate duration and exit without calling TTS
-if args.dry_run:
+    Returns: (sections, clean_text, inline_phonemes)
+    sections is empty when the script has no section markers.
+    Each section carries its own cleaned 'text' so chunks can be anchored per section.
+    """
+    # 提取每个章节的名称和开头文本用于精确匹配
+    sections = []
+    matches = list(re.finditer(SECTION_PATTERN, text))
+
+    for i, match in enumerate(matches):
+        section_name = match.group(1)
+        start_pos = match.end()
+        end_pos = matches[i+1].start() if i+1 < len(matches) else len(text)
+        section_text = text[start_pos:end_pos].strip()
+        # 提取章节开头的前50个字符用于匹配
+        first_text = re.sub(r'\s+', '', section_text[:80])  # 去除空白便于匹配
+        # 标记无旁白章节（空内容或仅空白）
+        is_silent = len(section_text.strip()) == 0
+        # Extract label: first line of section text (before first punctuation), capped at 10 chars
+        label_text = section_text.split('\n')[0].strip() if section_text.strip() else section_name
+        label = re.split(r'[，。！？、：；]', label_text)[0][:10] if label_text else section_name
+        if i == 0:
+            # 第一个章节标记之前的文本并入第一个章节
+            section_text = (text[:match.start()].strip() + "\n\n" + section_text).strip()
+        sections.append({
+            'name': section_name,
+            'label': label or section_name,
+            'first_text': first_text,
+            'text': clean_section_text(section_text),
+            'start_time': None,
+            'end_time': None,
+            'is_silent': is_silent
+        })
+
+    clean_text = re.sub(SECTION_PATTERN, '', text).strip()
+
+    # Extract inline phoneme markers: 执行器[zhí xíng qì]
+    clean_text, inline_phonemes = extract_inline_phonemes(clean_text)
+
+    # 处理读音替换
+    clean_text = re.sub(READ_AS_PATTERN, r"\2", clean_text)
+    return sections, clean_text, inline_phonemes
+
+
+def clean_section_text(section_text):
+    """Apply the same inline-phoneme and 读作 cleanup as the full script"""
+    section_text, _ = extract_inline_phonemes(section_text)
+    return re.sub(READ_AS_PATTERN, r"\2", section_text)
+
+
+def print_dry_run(clean_text, sections, speech_rate, backend):
+    """Estimate duration without calling TTS"""
     # Estimate: ~4 chars/sec for Chinese, ~3 words/sec for English
     cn_chars = len(re.findall(r'[\u4e00-\u9fff]', clean_text))
     en_words = len(re.findall(r'[A-Za-z]+', clean_text))
     est_duration = cn_chars / 4.0 + en_words / 3.0
     # Apply speech rate
-    rate_match = re.match(r'([+-]?\d+)%', SPEECH_RATE)
+    rate_match = re.match(r'([+-]?\d+)%', speech_rate)
     if rate_match:
         rate_factor = 1.0 + int(rate_match.group(1)) / 100.0
         est_duration /= rate_factor
@@ -282,32 +318,12 @@ if args.dry_run:
     print(f"Chinese chars: {cn_chars}, English words: {en_words}")
     print(f"Estimated duration: {est_duration:.0f}s ({est_duration/60:.1f}min)")
     print(f"Estimated frames: {est_frames} @ 30fps")
-    print(f"Speech rate: {SPEECH_RATE}")
-    print(f"Backend: {BACKEND} (not called)")
+    print(f"Speech rate: {speech_rate}")
+    print(f"Backend: {backend} (not called)")
     non_silent = [s for s in sections if not s.get('is_silent')]
     if len(non_silent) > 1:
         avg = est_duration / len(non_silent)
         print(f"Average section: ~{avg:.0f}s ({len(non_silent)} sections with content)")
-    sys.exit(0)
-
-# 分句分段
-sentences = clean_text.replace("；", "。").split("。")
-chunks = []
-current_chunk = ""
-
-for s in sentences:
-    s = s.strip()
-    if not s: continue
-    if len(current_chunk) + len(s) + 1 < MAX_CHARS:
-        current_chunk += s + "。"
-    else:
-        if current_chunk:
-            chunks.append(current_chunk)
-        current_chunk = s + "。"
-if current_chunk:
-    chunks.append(current_chunk)
-
-print(f"分成 {len(chunks)} 段")
 
 
 def mark_english_terms(text):
@@ -364,75 +380,340 @@ def mark_english_terms(text):
     return result
 
 
-def synth_azure(chunks, phoneme_dict, speech_rate, output_dir, resume=False):
-    import azure.cognitiveservices.speech as speechsdk
-
-    config = speechsdk.SpeechConfig(subscription=key, region=region)
-    config.SpeechSynthesisVoiceName = "zh-CN-XiaoxiaoMultilingualNeural"
-    part_files = []
-    word_boundaries = []
-    accumulated_duration = 0
-
-    for i, chunk in enumerate(chunks):
-        part_file = os.path.join(output_dir, f"part_{i}.wav")
-        part_files.append(part_file)
-
-        # Resume: skip if part file already exists
-        if resume and os.path.exists(part_file):
-            probe = subprocess.run(
-                ["ffprobe", "-v", "quiet", "-show_entries", "format=duration", "-of", "csv=p=0", part_file],
-                capture_output=True, text=True)
-            chunk_duration = float(probe.stdout.strip()) if probe.stdout.strip() else 0
-            print(f"  ⏭ Part {i + 1}/{len(chunks)} skipped (resume, {chunk_duration:.1f}s)")
-            accumulated_duration += chunk_duration
-            continue
-
-        audio = speechsdk.audio.AudioOutputConfig(filename=part_file)
-        synth = speechsdk.SpeechSynthesizer(speech_config=config, audio_config=audio)
-
-        def word_boundary_cb(evt):
-            word_boundaries.append({
-                "text": evt.text,
-                "offset": accumulated_duration + evt.audio_offset / 10000000.0,
-                "duration": evt.duration.total_seconds(),
-            })
-        synth.synthesis_word_boundary.connect(word_boundary_cb)
-
-        chunk_with_phonemes = apply_phonemes(chunk, phoneme_dict)
-        processed = mark_english_terms(chunk_with_phonemes)
+def build_azure_ssml(chunk, phoneme_dict, speech_rate):
+    chunk_with_phonemes = apply_phonemes(chunk, phoneme_dict)
+    processed = mark_english_terms(chunk_with_phonemes)
 
-        ssml = f"""<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis"
+    return f"""<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis"
                    xmlns:mstts="https://www.w3.org/2001/mstts" xml:lang="zh-CN">
-            <voice name="zh-CN-XiaoxiaoMultilingualNeural">
+            <voice name="{AZURE_VOICE}">
                 <mstts:express-as style="gentle">
                     <prosody rate="{speech_rate}">{processed}</prosody>
                 </mstts:express-as>
             </voice>
         </speak>"""
 
-        success = False
-        for attempt in range(1, 4):
-            result = synth.speak_ssml_async(ssml).get()
-            if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-                chunk_duration = result.audio_duration.total_seconds()
-                print(f"  ✓ Part {i + 1}/{len(chunks)} done ({len(chunk)} chars, {chunk_duration:.1f}s)")
-                accumulated_duration += chunk_duration
-                success = True
-                break
+
+# ============ 分句分段 ============
+SENTENCE_PATTERN = r'.+?(?:[。！？；]+[”’」』）)]*|[.!?;]+(?=\s|$)|$)'
+CLAUSE_PATTERN = r'.+?(?:[，、：,:]+|$)'
+
+
+def payload_cost(backend, text, phoneme_dict):
+    """Budget text consumes in a request: SSML body incl. markup for Azure, chars otherwise
+
+    Additive across sentences, so the packer can sum unit costs (see CHUNK_LIMITS).
+    """
+    if backend == "azure":
+        return len(mark_english_terms(apply_phonemes(text, phoneme_dict)))
+    return len(text)
+
+
+def payload_size(backend, chunk, phoneme_dict, speech_rate):
+    """Final request size for a chunk (full SSML document for Azure)"""
+    if backend == "azure":
+        return len(build_azure_ssml(chunk, phoneme_dict, speech_rate))
+    return len(chunk)
+
+
+def payload_limit(backend, speech_rate):
+    """Largest payload_size pack_chunks can produce: budget + constant envelope"""
+    return CHUNK_LIMITS[backend] + payload_size(backend, "", {}, speech_rate)
+
+
+def hard_split(text, backend, phoneme_dict, limit):
+    """Last resort for a clause over the limit: cut at the longest fitting prefix,
+    backing off so English words are not cut in half"""
+    pieces = []
+    while text and payload_cost(backend, text, phoneme_dict) > limit:
+        lo, hi = 1, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if payload_cost(backend, text[:mid], phoneme_dict) <= limit:
+                lo = mid
             else:
-                details = result.cancellation_details.error_details
-                print(f"  ✗ Part {i + 1} failed (attempt {attempt}/3): {details}")
-                if attempt < 3:
-                    time.sleep(attempt * 2)
+                hi = mid - 1
+        cut = lo
+        while cut > 1 and text[cut - 1].isascii() and text[cut - 1].isalnum() \
+                and text[cut].isascii() and text[cut].isalnum():
+            cut -= 1
+        if cut == 1:
+            cut = lo
+        pieces.append(text[:cut])
+        text = text[cut:]
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+def split_units(text, backend, phoneme_dict, limit):
+    """Split text into packable units: sentences, or clauses for oversize sentences
+
+    Returns a list of (text, payload_cost); punctuation and trailing spaces stay
+    with their unit so chunks can be rebuilt by plain concatenation.
+    """
+    units = []
+    for sentence in re.findall(SENTENCE_PATTERN, text, re.S):
+        if not sentence.strip():
+            continue
+        size = payload_cost(backend, sentence, phoneme_dict)
+        if size <= limit:
+            units.append((sentence, size))
+            continue
+        for clause in re.findall(CLAUSE_PATTERN, sentence, re.S):
+            if not clause.strip():
+                continue
+            clause_size = payload_cost(backend, clause, phoneme_dict)
+            # Aim for equal pieces first, fall back to the plain limit if that needs more cuts
+            count = -(-clause_size // limit)
+            pieces = hard_split(clause, backend, phoneme_dict, -(-clause_size // count))
+            if len(pieces) > count:
+                pieces = hard_split(clause, backend, phoneme_dict, limit)
+            for piece in pieces:
+                units.append((piece, payload_cost(backend, piece, phoneme_dict)))
+    return units
+
+
+def greedy_pack(sizes, capacity):
+    """Number of chunks when packing sizes in order without exceeding capacity"""
+    count, current = 0, None
+    for size in sizes:
+        if current is None or current + size > capacity:
+            count += 1
+            current = size
+        else:
+            current += size
+    return count
+
+
+def pack_chunks(text, backend, phoneme_dict, limit=None):
+    """Pack text into the fewest chunks under the backend payload limit,
+    then balance them so the largest chunk is as small as possible
+
+    Greedy packing gives the minimal chunk count k; a binary search over the
+    capacity then finds the smallest max-chunk size that still fits in k chunks,
+    so no chunk is a straggler when chunks are synthesized concurrently.
+    """
+    limit = limit or CHUNK_LIMITS[backend]
+    units = split_units(text, backend, phoneme_dict, limit)
+    if not units:
+        return []
+    sizes = [size for _, size in units]
+    target = greedy_pack(sizes, limit)
+
+    lo, hi = max(max(sizes), -(-sum(sizes) // target)), limit
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if greedy_pack(sizes, mid) <= target:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    chunks, current, current_size = [], "", 0
+    for unit, size in units:
+        if current and current_size + size > lo:
+            chunks.append(current.strip())
+            current, current_size = "", 0
+        current += unit
+        current_size += size
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+def anchor_hash(unit):
+    """Content hash of a unit's opening characters only, so editing the rest of
+    a sentence never changes which cut point wins"""
+    head = re.sub(r'\s+', '', unit)[:ANCHOR_PREFIX]
+    return int(hashlib.sha1(head.encode('utf-8')).hexdigest(), 16)
+
+
+def anchor_chunks(text, backend, phoneme_dict, limit=None):
+    """Pack text into chunks whose boundaries only depend on nearby content
+
+    The text stays one chunk if it fits. Otherwise each chunk ends before the
+    unit with the smallest anchor_hash among the cut points that leave it between
+    ANCHOR_MIN_FILL and 100% of the limit, so chunks stay large (close to the
+    pack_chunks count) while the cut an edit lands next to usually wins again —
+    a local edit re-synthesizes just the chunk containing it instead of
+    re-balancing every chunk after it.
+    """
+    limit = limit or CHUNK_LIMITS[backend]
+    units = split_units(text, backend, phoneme_dict, limit)
+    groups, start = [], 0
+    while start < len(units):
+        rest = units[start:]
+        if sum(size for _, size in rest) <= limit:
+            groups.append(rest)
+            break
+        size, end, candidates = 0, start, []
+        while end < len(units) and size + units[end][1] <= limit:
+            size += units[end][1]
+            end += 1
+            if size >= limit * ANCHOR_MIN_FILL and end < len(units):
+                candidates.append(end)
+        cut = min(candidates, key=lambda k: anchor_hash(units[k][0])) if candidates else max(end, start + 1)
+        groups.append(units[start:cut])
+        start = cut
+    # A short tail rides along with the previous chunk when both fit
+    if len(groups) > 1 and sum(size for _, size in groups[-2] + groups[-1]) <= limit:
+        groups[-2:] = [groups[-2] + groups[-1]]
+    chunks = [''.join(unit for unit, _ in group).strip() for group in groups]
+    return [c for c in chunks if c]
+
+
+def build_chunks(sections, clean_text, backend, phoneme_dict, anchor_sections=False):
+    """Chunk the whole script, or each section separately when anchor_sections is set
+
+    Anchoring keeps chunk boundaries stable across edits: sections are chunked
+    independently with content-defined cuts (anchor_chunks), so an edit normally
+    only changes the cache key of the chunk it lands in.
+    """
+    if not anchor_sections:
+        return pack_chunks(clean_text, backend, phoneme_dict)
+    return [c for s in sections for c in anchor_chunks(s['text'], backend, phoneme_dict)]
+
+
+def chunk_cache_key(backend, chunk, phoneme_dict, speech_rate):
+    """Hash everything that affects a chunk's audio (text, voice, rate, phonemes)"""
+    if backend == "azure":
+        payload = [build_azure_ssml(chunk, phoneme_dict, speech_rate)]
+    elif backend == "cosyvoice":
+        payload = [os.environ.get("COSYVOICE_MODEL", DEFAULT_COSYVOICE_MODEL),
+                   os.environ.get("COSYVOICE_VOICE", DEFAULT_COSYVOICE_VOICE),
+                   speech_rate, chunk]
+    else:
+        payload = [os.environ.get("EDGE_TTS_VOICE", DEFAULT_EDGE_VOICE), speech_rate, chunk]
+    raw = json.dumps([backend] + payload, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+def atomic_write(path, data):
+    """Write text/bytes via a temp file + rename so readers never see a partial file"""
+    tmp = os.path.join(os.path.dirname(path) or '.', f".{os.path.basename(path)}.tmp")
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    encoding = None if isinstance(data, bytes) else 'utf-8'
+    with open(tmp, mode, encoding=encoding) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def wav_header(data_size, sample_rate):
+    """44-byte header for 16-bit mono PCM WAV"""
+    return struct.pack('<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + data_size, b'WAVE',
+        b'fmt ', 16, 1, 1, sample_rate,
+        sample_rate * 2, 2, 16,
+        b'data', data_size)
+
+
+class CancelToken:
+    """Cancellation flag for one synthesis attempt that also stops its request
+
+    Backends register how to abort the in-flight call (on_cancel); set() fires it
+    right away, so a stuck request is stopped instead of just being ignored.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.abort = None
+
+    def is_set(self):
+        return self.event.is_set()
+
+    def set(self):
+        with self.lock:
+            self.event.set()
+            abort = self.abort
+        if abort:
+            self.fire(abort)
+
+    def on_cancel(self, abort):
+        """Register the abort call for the current request (runs now if already cancelled)"""
+        with self.lock:
+            self.abort = abort
+            cancelled = self.event.is_set()
+        if cancelled:
+            self.fire(abort)
+
+    @staticmethod
+    def fire(abort):
+        try:
+            abort()
+        except Exception:
+            pass  # request already finished / connection gone
+
+
+def is_cancelled(cancel):
+    return cancel is not None and cancel.is_set()
+
+
+def probe_duration(path):
+    probe = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        capture_output=True, text=True)
+    return float(probe.stdout.strip()) if probe.stdout.strip() else 0
+
+
+@functools.lru_cache(maxsize=None)
+def azure_config(key, region):
+    """SpeechConfig is built once per key/region and shared by all chunks"""
+    import azure.cognitiveservices.speech as speechsdk
+
+    config = speechsdk.SpeechConfig(subscription=key, region=region)
+    config.SpeechSynthesisVoiceName = AZURE_VOICE
+    return config
 
-        if not success:
-            raise RuntimeError(f"Part {i + 1} synthesis failed")
 
-    return part_files, word_boundaries, accumulated_duration
+def synth_azure(chunk, phoneme_dict, speech_rate, part_file, label, cancel=None):
+    """Synthesize one chunk to part_file. Returns (duration, words) with chunk-relative offsets
 
+    cancel: optional CancelToken set when a hedged duplicate already won
+    """
+    import azure.cognitiveservices.speech as speechsdk
+
+    config = azure_config(os.environ.get("AZURE_SPEECH_KEY"),
+                          os.environ.get("AZURE_SPEECH_REGION", "eastasia"))
+    audio = speechsdk.audio.AudioOutputConfig(filename=part_file)
+    synth = speechsdk.SpeechSynthesizer(speech_config=config, audio_config=audio)
+    if cancel is not None:
+        cancel.on_cancel(synth.stop_speaking_async)
+
+    words = []
 
-def synth_cosyvoice(chunks, phoneme_dict, speech_rate, output_dir, resume=False):
-    import struct
+    def word_boundary_cb(evt):
+        if is_cancelled(cancel):
+            return
+        words.append({
+            "text": evt.text,
+            "offset": evt.audio_offset / 10000000.0,
+            "duration": evt.duration.total_seconds(),
+        })
+    synth.synthesis_word_boundary.connect(word_boundary_cb)
+
+    ssml = build_azure_ssml(chunk, phoneme_dict, speech_rate)
+
+    for attempt in range(1, 4):
+        words.clear()
+        result = synth.speak_ssml_async(ssml).get()
+        if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
+            return result.audio_duration.total_seconds(), list(words)
+        if is_cancelled(cancel):
+            raise RuntimeError(f"{label} cancelled")
+        details = result.cancellation_details.error_details
+        print(f"  ✗ {label} failed (attempt {attempt}/3): {details}")
+        if attempt < 3:
+            time.sleep(attempt * 2)
+
+    raise RuntimeError(f"{label} synthesis failed")
+
+
+def synth_cosyvoice(chunk, phoneme_dict, speech_rate, part_file, label, cancel=None):
+    """Synthesize one chunk to part_file. Returns (duration, words) with chunk-relative offsets
+
+    cancel: optional CancelToken set when a hedged duplicate already won
+    """
     import json as _json
     from dashscope.audio.tts_v2 import SpeechSynthesizer, ResultCallback, AudioFormat
 
@@ -441,362 +722,1251 @@ def synth_cosyvoice(chunks, phoneme_dict, speech_rate, output_dir, resume=False)
     cosy_rate = 1.0 + int(rate_match.group(1)) / 100.0 if rate_match else 1.0
     cosy_rate = max(0.5, min(2.0, cosy_rate))
 
-    model = os.environ.get("COSYVOICE_MODEL", "cosyvoice-v3-flash")
-    voice = os.environ.get("COSYVOICE_VOICE", "longxiaochun_v3")
+    model = os.environ.get("COSYVOICE_MODEL", DEFAULT_COSYVOICE_MODEL)
+    voice = os.environ.get("COSYVOICE_VOICE", DEFAULT_COSYVOICE_VOICE)
     sample_rate = 48000
 
-    part_files = []
-    word_boundaries = []
-    accumulated_duration = 0
-
-    for i, chunk in enumerate(chunks):
-        part_file = os.path.join(output_dir, f"part_{i}.wav")
-        part_files.append(part_file)
-
-        # Resume: skip if part file already exists
-        if resume and os.path.exists(part_file):
-            probe = subprocess.run(
-                ["ffprobe", "-v", "quiet", "-show_entries", "format=duration", "-of", "csv=p=0", part_file],
-                capture_output=True, text=True)
-            chunk_duration = float(probe.stdout.strip()) if probe.stdout.strip() else 0
-            print(f"  ⏭ Part {i + 1}/{len(chunks)} skipped (resume, {chunk_duration:.1f}s)")
-            accumulated_duration += chunk_duration
-            continue
-
-        success = False
-        for attempt in range(1, 4):
+    class Callback(ResultCallback):
+        """Per-attempt sink: late packets from an earlier attempt's SDK thread
+        only ever reach that attempt's (closed) file and are dropped"""
+
+        def __init__(self, out, sentence_words):
+            self.out = out
+            self.sentence_words = sentence_words
+            self.written = 0
+
+        def on_event(self, message):
+            d = _json.loads(message)
+            sentence = d.get('payload', {}).get('output', {}).get('sentence', {})
+            words = sentence.get('words', [])
+            idx = sentence.get('index', 0)
+            if words:
+                self.sentence_words[idx] = words
+
+        def on_data(self, data):
+            if is_cancelled(cancel):
+                return
             try:
-                audio_buf = bytearray()
-                sentence_words = {}
-
-                class Callback(ResultCallback):
-                    def on_event(self, message):
-                        d = _json.loads(message)
-                        sentence = d.get('payload', {}).get('output', {}).get('sentence', {})
-                        words = sentence.get('words', [])
-                        idx = sentence.get('index', 0)
-                        if words:
-                            sentence_words[idx] = words
-                    def on_data(self, data):
-                        audio_buf.extend(data)
-                    def on_error(self, message):
-                        raise RuntimeError(f"CosyVoice error: {message}")
-
+                self.out.write(data)
+            except ValueError:
+                return  # attempt already finished/failed and its file is closed
+            self.written += len(data)
+
+        def on_error(self, message):
+            raise RuntimeError(f"CosyVoice error: {message}")
+
+    for attempt in range(1, 4):
+        try:
+            sentence_words = {}
+            # PCM goes straight to disk as it arrives; only the header is patched at the end
+            out = open(part_file, 'wb')
+            callback = Callback(out, sentence_words)
+            try:
+                out.write(wav_header(0, sample_rate))
                 synth = SpeechSynthesizer(
                     model=model,
                     voice=voice,
                     format=AudioFormat.PCM_48000HZ_MONO_16BIT,
                     speech_rate=cosy_rate,
-                    callback=Callback(),
+                    callback=callback,
                     additional_params={'word_timestamp_enabled': True},
                 )
+                if cancel is not None:
+                    cancel.on_cancel(synth.streaming_cancel)
                 synth.streaming_call(chunk)
                 synth.streaming_complete()
+            finally:
+                data_size = callback.written
+                out.seek(0)
+                out.write(wav_header(data_size, sample_rate))
+                out.close()
+
+            if is_cancelled(cancel):
+                raise RuntimeError(f"{label} cancelled")
+            if not data_size:
+                raise RuntimeError("No audio data received")
+
+            chunk_duration = data_size / (sample_rate * 2)
+
+            # Convert deduplicated word timestamps to word_boundaries format
+            words = []
+            for idx in sorted(sentence_words.keys()):
+                for w in sentence_words[idx]:
+                    words.append({
+                        "text": w["text"],
+                        "offset": w["begin_time"] / 1000.0,
+                        "duration": (w["end_time"] - w["begin_time"]) / 1000.0,
+                    })
+            return chunk_duration, words
+        except Exception as e:
+            if is_cancelled(cancel):
+                raise
+            print(f"  ✗ {label} failed (attempt {attempt}/3): {e}")
+            if attempt < 3:
+                time.sleep(attempt * 2)
+
+    raise RuntimeError(f"{label} synthesis failed")
+
+
+def synth_edge(chunk, phoneme_dict, speech_rate, part_file, label, cancel=None):
+    """Synthesize one chunk to part_file. Returns (duration, words) with chunk-relative offsets
+
+    cancel: optional CancelToken set when a hedged duplicate already won
+    """
+    import asyncio
+    import edge_tts
 
-                if not audio_buf:
-                    raise RuntimeError("No audio data received")
-
-                # Write proper WAV from PCM
-                pcm_data = bytes(audio_buf)
-                data_size = len(pcm_data)
-                wav_header = struct.pack('<4sI4s4sIHHIIHH4sI',
-                    b'RIFF', 36 + data_size, b'WAVE',
-                    b'fmt ', 16, 1, 1, sample_rate,
-                    sample_rate * 2, 2, 16,
-                    b'data', data_size)
-                with open(part_file, 'wb') as f:
-                    f.write(wav_header + pcm_data)
-
-                chunk_duration = data_size / (sample_rate * 2)
-
-                # Convert deduplicated word timestamps to word_boundaries format
-                for idx in sorted(sentence_words.keys()):
-                    for w in sentence_words[idx]:
-                        word_boundaries.append({
-                            "text": w["text"],
-                            "offset": accumulated_duration + w["begin_time"] / 1000.0,
-                            "duration": (w["end_time"] - w["begin_time"]) / 1000.0,
-                        })
-
-                print(f"  ✓ Part {i + 1}/{len(chunks)} done ({len(chunk)} chars, {chunk_duration:.1f}s)")
-                accumulated_duration += chunk_duration
-                success = True
-                break
-            except Exception as e:
-                print(f"  ✗ Part {i + 1} failed (attempt {attempt}/3): {e}")
-                if attempt < 3:
-                    time.sleep(attempt * 2)
+    voice = os.environ.get("EDGE_TTS_VOICE", DEFAULT_EDGE_VOICE)
+    mp3_file = part_file.replace('.wav', '.mp3')
+
+    async def stream(out, chunk_words):
+        if cancel is not None:
+            loop, task = asyncio.get_running_loop(), asyncio.current_task()
+            cancel.on_cancel(lambda: loop.call_soon_threadsafe(task.cancel))
+        communicate = edge_tts.Communicate(
+            chunk, voice=voice, rate=speech_rate, boundary='WordBoundary')
+
+        async for event in communicate.stream():
+            if is_cancelled(cancel):
+                raise RuntimeError(f"{label} cancelled")
+            if event["type"] == "audio":
+                out.write(event["data"])
+            elif event["type"] == "WordBoundary":
+                chunk_words.append({
+                    "text": event["text"],
+                    "offset": event["offset"] / 10_000_000,
+                    "duration": event["duration"] / 10_000_000,
+                })
+
+    for attempt in range(1, 4):
+        try:
+            chunk_words = []
+            # Stream MP3 to disk, then convert to WAV via ffmpeg
+            with open(mp3_file, 'wb') as f:
+                try:
+                    asyncio.run(stream(f, chunk_words))
+                except asyncio.CancelledError:
+                    raise RuntimeError(f"{label} cancelled")
+
+            if not os.path.getsize(mp3_file):
+                raise RuntimeError("No audio data received")
+
+            subprocess.run(
+                ["ffmpeg", "-y", "-i", mp3_file, "-ar", "48000", "-ac", "1", part_file],
+                capture_output=True)
+            os.remove(mp3_file)
+
+            # Get actual duration from WAV
+            return probe_duration(part_file), chunk_words
+        except Exception as e:
+            if os.path.exists(mp3_file):
+                os.remove(mp3_file)
+            if is_cancelled(cancel):
+                raise
+            print(f"  ✗ {label} failed (attempt {attempt}/3): {e}")
+            if attempt < 3:
+                time.sleep(attempt * 2)
 
-        if not success:
-            raise RuntimeError(f"Part {i + 1} synthesis failed")
+    raise RuntimeError(f"{label} synthesis failed")
 
-    return part_files, word_boundaries, accumulated_duration
 
+SYNTH_BACKENDS = {
+    "azure": synth_azure,
+    "cosyvoice": synth_cosyvoice,
+    "edge": synth_edge,
+}
 
-def synth_edge(chunks, phoneme_dict, speech_rate, output_dir, resume=False):
-    import asyncio
-    import edge_tts
 
-    voice = os.environ.get("EDGE_TTS_VOICE", "zh-CN-XiaoxiaoNeural")
-    part_files = []
-    word_boundaries = []
-    accumulated_duration = 0
+# ============ Hedged requests ============
+def latency_history_file():
+    """Per-user hedge latency history, shared by all episodes"""
+    config_dir = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(config_dir, "video-podcast-maker", "latency_history.json")
 
-    async def synthesize_chunk(i, chunk):
-        nonlocal accumulated_duration
-        part_file = os.path.join(output_dir, f"part_{i}.wav")
-        part_files.append(part_file)
 
-        # Resume: skip if part file already exists
-        if resume and os.path.exists(part_file):
-            # Get duration from existing file
-            probe = subprocess.run(
-                ["ffprobe", "-v", "quiet", "-show_entries", "format=duration", "-of", "csv=p=0", part_file],
-                capture_output=True, text=True)
-            chunk_duration = float(probe.stdout.strip()) if probe.stdout.strip() else 0
-            print(f"  ⏭ Part {i + 1}/{len(chunks)} skipped (resume, {chunk_duration:.1f}s)")
-            accumulated_duration += chunk_duration
-            return
+def percentile(values, pct):
+    """Nearest-rank percentile (values need not be sorted)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class RunMetrics:
+    """Per-chunk latency and hedge records for one run
+
+    Latency is tracked as seconds per payload unit (see CHUNK_LIMITS) so the
+    hedge threshold scales with chunk size. Samples persist per user and backend
+    (latency_history_file), shared by all episodes, so once any earlier run has
+    recorded HEDGE_MIN_SAMPLES chunks a new episode hedges from its first chunk.
+    Only run_metrics.json lives in the episode's chunk cache.
+    """
+
+    def __init__(self, backend, cache_dir):
+        self.backend = backend
+        self.history_file = latency_history_file()
+        self.metrics_file = os.path.join(cache_dir, "run_metrics.json")
+        self.rates = self.load_history().get(backend, [])
+        self.new_rates = []
+        self.chunks = []
+        self.started = time.time()
+
+    def hedge_delay(self, size):
+        """Seconds to wait before hedging a chunk of this payload size (None = no data yet)"""
+        if len(self.rates) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, percentile(self.rates, 95) * size)
+
+    def record(self, label, size, wall_time, latency, hedge_delay=None, hedged_at=None, winner="primary",
+               hedge_latency=None):
+        """latency is the primary request's time (a lower bound when the hedge won);
+        only it feeds the history, so winning hedges don't drag the p95 down"""
+        self.chunks.append({
+            'label': label,
+            'payload': size,
+            'wall_time': round(wall_time, 3),
+            'latency': round(latency, 3),
+            'hedge_delay': round(hedge_delay, 3) if hedge_delay is not None else None,
+            'hedged_at': round(hedged_at, 3) if hedged_at is not None else None,
+            'hedge_latency': round(hedge_latency, 3) if hedge_latency is not None else None,
+            'winner': winner,
+        })
+        if size:
+            self.rates = (self.rates + [latency / size])[-LATENCY_HISTORY:]
+            self.new_rates.append(latency / size)
+
+    def load_history(self):
+        try:
+            with open(self.history_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, hedge):
+        walls = [c['wall_time'] for c in self.chunks]
+        hedged = [c for c in self.chunks if c['hedged_at'] is not None]
+        summary = {
+            'backend': self.backend,
+            'hedge': hedge,
+            'synthesized_chunks': len(self.chunks),
+            'wall_time': round(time.time() - self.started, 3),
+            'chunk_p50': percentile(walls, 50),
+            'chunk_p95': percentile(walls, 95),
+            'chunk_p99': percentile(walls, 99),
+            'hedges_sent': len(hedged),
+            'hedges_won': sum(1 for c in hedged if c['winner'] == 'hedge'),
+            # Hedged chunks are billed (up to) twice
+            'extra_payload': sum(c['payload'] for c in hedged),
+            'chunks': self.chunks,
+        }
+        atomic_write(self.metrics_file, json.dumps(summary, indent=2, ensure_ascii=False))
+        # Re-read so samples saved meanwhile by other episodes/processes are kept
+        history = self.load_history()
+        history[self.backend] = (history.get(self.backend, []) + self.new_rates)[-LATENCY_HISTORY:]
+        os.makedirs(os.path.dirname(self.history_file), exist_ok=True)
+        atomic_write(self.history_file, json.dumps(history))
+        return summary
+
+
+# Temp-file stems (part_<key>.tryN) of hedge attempts still running in this process
+_active_attempts = set()
+_active_attempts_lock = threading.Lock()
+
 
-        mp3_file = part_file.replace('.wav', '.mp3')
+def is_active_attempt(path):
+    with _active_attempts_lock:
+        return os.path.splitext(path)[0] in _active_attempts
 
-        success = False
-        for attempt in range(1, 4):
+
+def remove_stale_attempts(cache_dir):
+    """Delete .tryN files left by hedge attempts of an earlier process (exit/Ctrl+C mid-attempt)"""
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith("part_") and ".try" in name and not is_active_attempt(path):
             try:
-                audio_data = bytearray()
-                chunk_words = []
-
-                communicate = edge_tts.Communicate(
-                    chunk, voice=voice, rate=speech_rate, boundary='WordBoundary')
-
-                async for event in communicate.stream():
-                    if event["type"] == "audio":
-                        audio_data.extend(event["data"])
-                    elif event["type"] == "WordBoundary":
-                        chunk_words.append({
-                            "text": event["text"],
-                            "offset": accumulated_duration + event["offset"] / 10_000_000,
-                            "duration": event["duration"] / 10_000_000,
-                        })
-
-                if not audio_data:
-                    raise RuntimeError("No audio data received")
-
-                # Write MP3, convert to WAV via ffmpeg
-                with open(mp3_file, 'wb') as f:
-                    f.write(bytes(audio_data))
-                subprocess.run(
-                    ["ffmpeg", "-y", "-i", mp3_file, "-ar", "48000", "-ac", "1", part_file],
-                    capture_output=True)
-                os.remove(mp3_file)
+                os.remove(path)
+            except FileNotFoundError:
+                pass
 
-                # Get actual duration from WAV
-                probe = subprocess.run(
-                    ["ffprobe", "-v", "quiet", "-show_entries", "format=duration", "-of", "csv=p=0", part_file],
-                    capture_output=True, text=True)
-                chunk_duration = float(probe.stdout.strip())
-
-                word_boundaries.extend(chunk_words)
-                print(f"  ✓ Part {i + 1}/{len(chunks)} done ({len(chunk)} chars, {chunk_duration:.1f}s)")
-                accumulated_duration += chunk_duration
-                success = True
-                break
-            except Exception as e:
-                print(f"  ✗ Part {i + 1} failed (attempt {attempt}/3): {e}")
-                if attempt < 3:
-                    time.sleep(attempt * 2)
 
-        if not success:
-            raise RuntimeError(f"Part {i + 1} synthesis failed")
+def synth_hedged(synth_chunk, chunk, phoneme_dict, speech_rate, part_file, label, delay):
+    """Run synth_chunk, sending a duplicate request if it is still running after delay
 
-    async def run_all():
-        for i, chunk in enumerate(chunks):
-            await synthesize_chunk(i, chunk)
+    The first attempt to succeed is moved to part_file; the other is cancelled
+    and its temp file removed. Returns (duration, words, latency, hedged_at, winner,
+    hedge_latency): latency is always the primary's elapsed time (still running
+    when the hedge won), hedge_latency the winning hedge's own time.
+    """
+    done = queue.Queue()
+    attempts = []
+
+    def launch(n):
+        cancel = CancelToken()
+        tmp_file = os.path.splitext(part_file)[0] + f".try{n}.wav"
+        attempt_label = label if n == 0 else f"{label} (hedge)"
+        started = time.time()
+        with _active_attempts_lock:
+            _active_attempts.add(os.path.splitext(tmp_file)[0])
+
+        def run():
+            try:
+                result = synth_chunk(chunk, phoneme_dict, speech_rate, tmp_file, attempt_label, cancel=cancel)
+                done.put((n, result, None, time.time() - started))
+            except Exception as e:
+                done.put((n, None, e, time.time() - started))
+            try:
+                if cancel.is_set() and os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+            finally:
+                with _active_attempts_lock:
+                    _active_attempts.discard(os.path.splitext(tmp_file)[0])
+
+        attempts.append((cancel, tmp_file))
+        threading.Thread(target=run, daemon=True).start()
+
+    start = time.time()
+    launch(0)
+    hedged_at = None
+    pending = 1
+    while True:
+        timeout = None
+        if delay is not None and hedged_at is None:
+            timeout = max(0, start + delay - time.time())
+        try:
+            n, result, error, latency = done.get(timeout=timeout)
+        except queue.Empty:
+            hedged_at = time.time() - start
+            print(f"  ⇉ {label} still running after {hedged_at:.1f}s, sending hedge request")
+            launch(1)
+            pending += 1
+            continue
+        pending -= 1
+        if error is None:
+            break
+        if pending == 0:
+            raise error
+
+    for i, (cancel, tmp_file) in enumerate(attempts):
+        if i != n:
+            cancel.set()
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    os.replace(attempts[n][1], part_file)
+    duration, words = result
+    if n == 1:
+        return duration, words, time.time() - start, hedged_at, "hedge", latency
+    return duration, words, latency, hedged_at, "primary", None
+
+
+def synthesize(chunks, phoneme_dict, backend, speech_rate, output_dir, reuse=False, hedge=False,
+               progress=None):
+    """Synthesize all chunks through the per-chunk cache
+
+    With reuse=True, chunks whose cache entry already exists are not sent to the
+    backend again — this is what --resume and --watch rely on.
+    With hedge=True, slow chunks get a duplicate request (see synth_hedged).
+    progress(done, total) is called after each chunk.
+    Returns (part_files, word_boundaries, total_duration, synthesized_count).
+    """
+    synth_chunk = SYNTH_BACKENDS[backend]
+    cache_dir = os.path.join(output_dir, CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    remove_stale_attempts(cache_dir)
+    metrics = RunMetrics(backend, cache_dir)
+
+    part_files = []
+    word_boundaries = []
+    accumulated_duration = 0
+    synthesized = 0
 
-    asyncio.run(run_all())
-    return part_files, word_boundaries, accumulated_duration
+    for i, chunk in enumerate(chunks):
+        key = chunk_cache_key(backend, chunk, phoneme_dict, speech_rate)
+        part_file = os.path.join(cache_dir, f"part_{key}.flac")
+        meta_file = os.path.join(cache_dir, f"part_{key}.json")
+        part_files.append(part_file)
+        label = f"Part {i + 1}"
 
+        if reuse and os.path.exists(part_file) and os.path.exists(meta_file):
+            with open(meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            chunk_duration, words = meta['duration'], meta['words']
+            print(f"  ⏭ {label}/{len(chunks)} skipped (cached, {chunk_duration:.1f}s)")
+        else:
+            size = payload_cost(backend, chunk, phoneme_dict)
+            delay = metrics.hedge_delay(size) if hedge else None
+            started = time.time()
+            wav_file = os.path.join(cache_dir, f"part_{key}.wav")
+            chunk_duration, words, latency, hedged_at, winner, hedge_latency = synth_hedged(
+                synth_chunk, chunk, phoneme_dict, speech_rate, wav_file, label, delay)
+            compress_part(wav_file, part_file)
+            metrics.record(label, size, time.time() - started, latency, delay, hedged_at, winner,
+                           hedge_latency)
+            # meta 文件最后写入，作为该段缓存完整的标记（同时记录时长，无需 ffprobe）
+            atomic_write(meta_file, json.dumps(
+                {'text': chunk, 'duration': chunk_duration, 'words': words}, ensure_ascii=False))
+            print(f"  ✓ {label}/{len(chunks)} done ({len(chunk)} chars, {chunk_duration:.1f}s)")
+            synthesized += 1
+
+        for w in words:
+            word_boundaries.append({**w, "offset": accumulated_duration + w["offset"]})
+        accumulated_duration += chunk_duration
+        if progress:
+            progress(i + 1, len(chunks))
+
+    atomic_write(os.path.join(cache_dir, CACHE_MANIFEST),
+                 json.dumps({'parts': [os.path.basename(pf) for pf in part_files]}, indent=1))
+    if synthesized:
+        summary = metrics.save(hedge)
+        print(f"  ⏱ chunk p50/p95/p99: {summary['chunk_p50']:.1f}/{summary['chunk_p95']:.1f}/{summary['chunk_p99']:.1f}s"
+              f", hedges: {summary['hedges_sent']} sent / {summary['hedges_won']} won"
+              f" (+{summary['extra_payload']} payload) → {metrics.metrics_file}")
+    return part_files, word_boundaries, accumulated_duration, synthesized
 
-# TTS synthesis
-if BACKEND == "azure":
-    part_files, word_boundaries, total_duration = synth_azure(chunks, phoneme_dict, SPEECH_RATE, args.output_dir, resume=args.resume)
-elif BACKEND == "cosyvoice":
-    part_files, word_boundaries, total_duration = synth_cosyvoice(chunks, phoneme_dict, SPEECH_RATE, args.output_dir, resume=args.resume)
-elif BACKEND == "edge":
-    part_files, word_boundaries, total_duration = synth_edge(chunks, phoneme_dict, SPEECH_RATE, args.output_dir, resume=args.resume)
-print(f"\n✓ 收集到 {len(word_boundaries)} 个词边界")
-print(f"✓ 总时长: {total_duration:.1f} 秒")
 
 # ============ 精确章节时间匹配 ============
-# 使用滑动窗口在 word_boundaries 中搜索每个章节的开头文本
-if len(sections) > 1 and word_boundaries:
-    print("\n匹配章节时间...")
-
-    wb_texts = [wb['text'] for wb in word_boundaries]
-
-    # 第一个章节从0开始
-    sections[0]['start_time'] = 0
-
-    # 关键：按顺序搜索，从上一个匹配位置往后找
-    search_start = 0
-
-    for sec_idx, section in enumerate(sections[1:], 1):
-        target = section['first_text'][:30]
-        target_clean = re.sub(r'[，。！？、：；""''\s]', '', target)
-
-        found = False
-        # 从 search_start 开始搜索（确保章节按顺序）
-        for i in range(search_start, len(word_boundaries)):
-            window = ''
-            for j in range(i, min(i + 30, len(word_boundaries))):
-                window += wb_texts[j]
-                window_clean = re.sub(r'[，。！？、：；""''\s]', '', window)
-
-                # 检查窗口开头是否匹配目标开头（而不是包含）
-                if len(window_clean) >= 10 and window_clean.startswith(target_clean[:12]):
-                    section['start_time'] = word_boundaries[i]['offset']
-                    sections[sec_idx - 1]['end_time'] = section['start_time']
-                    search_start = i + 1  # 下一个章节从这里往后找
-                    print(f"  ✓ {section['name']}: {section['start_time']:.2f}s (匹配: \"{window[:20]}...\")")
-                    found = True
+def align_sections(sections, word_boundaries, total_duration):
+    """Fill start_time/end_time/duration of each section in place"""
+    # 使用滑动窗口在 word_boundaries 中搜索每个章节的开头文本
+    if len(sections) > 1 and word_boundaries:
+        print("\n匹配章节时间...")
+
+        wb_texts = [wb['text'] for wb in word_boundaries]
+
+        # 第一个章节从0开始
+        sections[0]['start_time'] = 0
+
+        # 关键：按顺序搜索，从上一个匹配位置往后找
+        search_start = 0
+
+        for sec_idx, section in enumerate(sections[1:], 1):
+            target = section['first_text'][:30]
+            target_clean = re.sub(r'[，。！？、：；""''\s]', '', target)
+
+            found = False
+            # 从 search_start 开始搜索（确保章节按顺序）
+            for i in range(search_start, len(word_boundaries)):
+                window = ''
+                for j in range(i, min(i + 30, len(word_boundaries))):
+                    window += wb_texts[j]
+                    window_clean = re.sub(r'[，。！？、：；""''\s]', '', window)
+
+                    # 检查窗口开头是否匹配目标开头（而不是包含）
+                    if len(window_clean) >= 10 and window_clean.startswith(target_clean[:12]):
+                        section['start_time'] = word_boundaries[i]['offset']
+                        sections[sec_idx - 1]['end_time'] = section['start_time']
+                        search_start = i + 1  # 下一个章节从这里往后找
+                        print(f"  ✓ {section['name']}: {section['start_time']:.2f}s (匹配: \"{window[:20]}...\")")
+                        found = True
+                        break
+                if found:
                     break
-            if found:
-                break
-
-        if not found:
-            # 回退：在上个章节后按比例估算
-            prev_time = sections[sec_idx - 1]['start_time']
-            remaining = total_duration - prev_time
-            remaining_sections = len(sections) - sec_idx
-            section['start_time'] = prev_time + remaining / (remaining_sections + 1)
-            sections[sec_idx - 1]['end_time'] = section['start_time']
-            print(f"  ⚠ {section['name']}: {section['start_time']:.2f}s (估算, 未找到: \"{target_clean[:15]}\")")
-
-    # 处理末尾的静音章节（如 outro）
-    # 静音章节从音频结束时刻开始，持续时间为0（由Remotion额外添加）
-    for i in range(len(sections) - 1, -1, -1):
-        if sections[i].get('is_silent', False):
-            sections[i]['start_time'] = total_duration
-            sections[i]['end_time'] = total_duration
-            sections[i]['duration'] = 0
-            # 前一个章节的结束时间也是音频结束
-            if i > 0:
-                sections[i-1]['end_time'] = total_duration
-            print(f"  ℹ {sections[i]['name']}: 静音章节，由Remotion额外添加时长")
-        else:
-            break  # 遇到非静音章节就停止
-
-    # 最后一个有内容的章节结束于音频结尾
-    for section in sections:
-        if section['end_time'] is None:
-            section['end_time'] = total_duration
-
-    # 计算持续时间
-    for section in sections:
-        if 'duration' not in section or section['duration'] is None:
-            section['duration'] = section['end_time'] - section['start_time']
-elif len(sections) > 1 and not word_boundaries:
-    # No word boundaries (e.g. full resume) - use proportional estimation
-    print("\n⚠ 无词边界数据（断点续传），使用比例估算章节时间...")
-    non_silent = [s for s in sections if not s.get('is_silent')]
-    if non_silent:
-        avg_duration = total_duration / len(non_silent)
-        t = 0
-        for s in sections:
-            s['start_time'] = t
-            if s.get('is_silent'):
-                s['end_time'] = total_duration
-                s['duration'] = 0
+
+            if not found:
+                # 回退：在上个章节后按比例估算
+                prev_time = sections[sec_idx - 1]['start_time']
+                remaining = total_duration - prev_time
+                remaining_sections = len(sections) - sec_idx
+                section['start_time'] = prev_time + remaining / (remaining_sections + 1)
+                sections[sec_idx - 1]['end_time'] = section['start_time']
+                print(f"  ⚠ {section['name']}: {section['start_time']:.2f}s (估算, 未找到: \"{target_clean[:15]}\")")
+
+        # 处理末尾的静音章节（如 outro）
+        # 静音章节从音频结束时刻开始，持续时间为0（由Remotion额外添加）
+        for i in range(len(sections) - 1, -1, -1):
+            if sections[i].get('is_silent', False):
+                sections[i]['start_time'] = total_duration
+                sections[i]['end_time'] = total_duration
+                sections[i]['duration'] = 0
+                # 前一个章节的结束时间也是音频结束
+                if i > 0:
+                    sections[i-1]['end_time'] = total_duration
+                print(f"  ℹ {sections[i]['name']}: 静音章节，由Remotion额外添加时长")
             else:
-                t += avg_duration
-                s['end_time'] = min(t, total_duration)
-                s['duration'] = s['end_time'] - s['start_time']
-    for s in sections:
-        print(f"  ≈ {s['name']}: {s['start_time']:.1f}s - {s['end_time']:.1f}s ({s['duration']:.1f}s)")
-else:
-    sections[0]['start_time'] = 0
-    sections[0]['end_time'] = total_duration
-    sections[0]['duration'] = total_duration
-
-# 合并音频
-print("\n合并音频...")
-concat_list = os.path.join(args.output_dir, "concat_list.txt")
-output_wav = os.path.join(args.output_dir, "podcast_audio.wav")
-with open(concat_list, "w") as f:
-    for pf in part_files:
-        f.write(f"file '{os.path.basename(pf)}'\n")
-
-subprocess.run(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_list, "-c", "copy", output_wav], capture_output=True, cwd=args.output_dir)
-# Keep part_*.wav and concat_list.txt for debugging - cleanup via Step 14
-print(f"✓ 完成: {output_wav}")
-print(f"  临时文件保留: {len(part_files)} 个 part_*.wav (手动清理: Step 14)")
+                break  # 遇到非静音章节就停止
+
+        # 最后一个有内容的章节结束于音频结尾
+        for section in sections:
+            if section['end_time'] is None:
+                section['end_time'] = total_duration
+
+        # 计算持续时间
+        for section in sections:
+            if 'duration' not in section or section['duration'] is None:
+                section['duration'] = section['end_time'] - section['start_time']
+    elif len(sections) > 1 and not word_boundaries:
+        # No word boundaries (e.g. cache entries without timestamps) - use proportional estimation
+        print("\n⚠ 无词边界数据，使用比例估算章节时间...")
+        non_silent = [s for s in sections if not s.get('is_silent')]
+        if non_silent:
+            avg_duration = total_duration / len(non_silent)
+            t = 0
+            for s in sections:
+                s['start_time'] = t
+                if s.get('is_silent'):
+                    s['end_time'] = total_duration
+                    s['duration'] = 0
+                else:
+                    t += avg_duration
+                    s['end_time'] = min(t, total_duration)
+                    s['duration'] = s['end_time'] - s['start_time']
+        for s in sections:
+            print(f"  ≈ {s['name']}: {s['start_time']:.1f}s - {s['end_time']:.1f}s ({s['duration']:.1f}s)")
+    else:
+        sections[0]['start_time'] = 0
+        sections[0]['end_time'] = total_duration
+        sections[0]['duration'] = total_duration
+
+
+def compress_part(wav_file, flac_file):
+    """Store a synthesized chunk as lossless FLAC (about half the size of PCM WAV)"""
+    tmp_flac = os.path.splitext(flac_file)[0] + ".tmp.flac"
+    subprocess.run(["ffmpeg", "-y", "-i", wav_file, "-c:a", "flac", tmp_flac],
+                   capture_output=True, check=True)
+    os.replace(tmp_flac, flac_file)
+    os.remove(wav_file)
+
+
+def concat_parts(part_files, output_dir):
+    """Decode and concatenate cached FLAC parts into podcast_audio.wav (atomic replace)"""
+    cache_dir = os.path.join(output_dir, CACHE_DIR)
+    concat_list = os.path.join(cache_dir, "concat_list.txt")
+    output_wav = os.path.join(output_dir, "podcast_audio.wav")
+    tmp_wav = os.path.join(output_dir, ".podcast_audio.wav.tmp")
+    with open(concat_list, "w") as f:
+        for pf in part_files:
+            f.write(f"file '{os.path.relpath(pf, cache_dir)}'\n")
+
+    subprocess.run(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", concat_list,
+                    "-c:a", "pcm_s16le", "-f", "wav", tmp_wav],
+                   capture_output=True, check=True)
+    os.replace(tmp_wav, output_wav)
+    return output_wav
+
+
+def prune_cache(output_dir, part_files, policy):
+    """Apply the cache policy after a successful run (see CACHE_POLICIES)
+
+    Run metrics and the cache manifest are always kept; they are tiny.
+    """
+    if policy == "all":
+        return
+    cache_dir = os.path.join(output_dir, CACHE_DIR)
+    keep = set()
+    if policy == "used":
+        for pf in part_files:
+            keep.add(os.path.basename(pf))
+            keep.add(os.path.basename(os.path.splitext(pf)[0] + ".json"))
+    removed = 0
+    for name in os.listdir(cache_dir):
+        # A losing hedge attempt may still be running and will clean up its own file
+        if is_active_attempt(os.path.join(cache_dir, name)):
+            continue
+        if (name.startswith("part_") or name == "concat_list.txt") and name not in keep:
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                continue
+            removed += 1
+    if removed:
+        print(f"  清理分段缓存: 删除 {removed} 个文件 (policy: {policy})")
+
 
 # 生成 SRT 字幕
-print("\n生成字幕...")
 def format_time(seconds):
     h, m = int(seconds // 3600), int((seconds % 3600) // 60)
     s, ms = int(seconds % 60), int((seconds % 1) * 1000)
     return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
 
-srt_lines = []
-subtitle_idx = 1
-current_text = ""
-start_time = end_time = 0
-
-for i, wb in enumerate(word_boundaries):
-    if not current_text:
-        start_time = wb["offset"]
-    current_text += wb["text"]
-    end_time = wb["offset"] + wb["duration"]
-
-    is_strong = wb["text"] in ["。", "！", "？"]
-    is_weak = wb["text"] in ["；", ",", "，"]
-    is_last = i == len(word_boundaries) - 1
-    text_len = len(current_text)
-
-    should_break = is_last or (is_strong and text_len > 15) or (is_weak and text_len > 25) or text_len > 35
-
-    if should_break:
-        # 清理首尾标点
-        clean_subtitle = re.sub(r'^[，。！？、：；""''…—\s]+|[，。！？、：；""''…—\s]+$', '', current_text.strip())
-        if clean_subtitle:
-            srt_lines.append(f"{subtitle_idx}\n{format_time(start_time)} --> {format_time(end_time)}\n{clean_subtitle}\n\n")
-            subtitle_idx += 1
-        current_text = ""
-
-output_srt = os.path.join(args.output_dir, "podcast_audio.srt")
-with open(output_srt, "w", encoding="utf-8") as f:
-    f.writelines(srt_lines)
-print(f"✓ 字幕: {output_srt} ({len(srt_lines)} 条)")
+
+def build_srt(word_boundaries):
+    srt_lines = []
+    subtitle_idx = 1
+    current_text = ""
+    start_time = end_time = 0
+
+    for i, wb in enumerate(word_boundaries):
+        if not current_text:
+            start_time = wb["offset"]
+        current_text += wb["text"]
+        end_time = wb["offset"] + wb["duration"]
+
+        is_strong = wb["text"] in ["。", "！", "？"]
+        is_weak = wb["text"] in ["；", ",", "，"]
+        is_last = i == len(word_boundaries) - 1
+        text_len = len(current_text)
+
+        should_break = is_last or (is_strong and text_len > 15) or (is_weak and text_len > 25) or text_len > 35
+
+        if should_break:
+            # 清理首尾标点
+            clean_subtitle = re.sub(r'^[，。！？、：；""''…—\s]+|[，。！？、：；""''…—\s]+$', '', current_text.strip())
+            if clean_subtitle:
+                srt_lines.append(f"{subtitle_idx}\n{format_time(start_time)} --> {format_time(end_time)}\n{clean_subtitle}\n\n")
+                subtitle_idx += 1
+            current_text = ""
+
+    return srt_lines
+
 
 # 生成 timing.json 供 Remotion 使用
-timing_data = {
-    'total_duration': total_duration,
-    'fps': 30,
-    'total_frames': int(total_duration * 30),
-    'speech_rate': SPEECH_RATE,
-    'sections': [
-        {
-            'name': s['name'],
-            'label': s.get('label', s['name']),
-            'start_time': round(s['start_time'], 3),
-            'end_time': round(s['end_time'], 3),
-            'duration': round(s['duration'], 3),
-            'start_frame': int(s['start_time'] * 30),
-            'duration_frames': int(s['duration'] * 30),
-            'is_silent': s.get('is_silent', False)
+def build_timing(sections, total_duration, speech_rate):
+    return {
+        'total_duration': total_duration,
+        'fps': 30,
+        'total_frames': int(total_duration * 30),
+        'speech_rate': speech_rate,
+        'sections': [
+            {
+                'name': s['name'],
+                'label': s.get('label', s['name']),
+                'start_time': round(s['start_time'], 3),
+                'end_time': round(s['end_time'], 3),
+                'duration': round(s['duration'], 3),
+                'start_frame': int(s['start_time'] * 30),
+                'duration_frames': int(s['duration'] * 30),
+                'is_silent': s.get('is_silent', False)
+            }
+            for s in sections
+        ]
+    }
+
+
+FICLONE = 0x40049409  # Linux ioctl: copy-on-write clone (btrfs, XFS, bcachefs)
+
+
+def reflink(src, dst):
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def link_or_copy(src, dst):
+    """Place src at dst via hardlink, then reflink, then plain copy (atomic replace)
+
+    Outputs are always rewritten via rename, never in place, so a hardlinked
+    copy in public/ can't be modified behind Remotion's back.
+    Returns the method used.
+    """
+    tmp = os.path.join(os.path.dirname(dst) or '.', f".{os.path.basename(dst)}.tmp")
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+        method = "hardlink"
+    except OSError:
+        try:
+            reflink(src, tmp)
+            method = "reflink"
+        except (OSError, ImportError):
+            shutil.copyfile(src, tmp)
+            method = "copy"
+    os.replace(tmp, dst)
+    return method
+
+
+def publish_outputs(output_dir, public_dir):
+    """Publish podcast_audio.wav/.srt and timing.json into public/ without copying when possible"""
+    os.makedirs(public_dir, exist_ok=True)
+    methods = {link_or_copy(os.path.join(output_dir, name), os.path.join(public_dir, name))
+               for name in OUTPUT_FILES}
+    print(f"✓ 已同步到: {public_dir}/ ({', '.join(OUTPUT_FILES)}, {'/'.join(sorted(methods))})")
+
+
+def generate(args, backend, speech_rate, reuse=False, progress=None):
+    """Run one full pass: parse → synthesize → align → write audio/SRT/timing
+
+    Returns a summary dict (None for --dry-run).
+    """
+    with open(args.input, "r") as f:
+        text = f.read().strip()
+
+    sections, clean_text, inline_phonemes = parse_script(text)
+    if inline_phonemes:
+        print(f"✓ 提取内联多音字标注: {len(inline_phonemes)} 条")
+        for word, pinyin in inline_phonemes.items():
+            print(f"    {word} → {pinyin}")
+
+    # Load phoneme dictionary (file-based)
+    file_phonemes = load_phoneme_dict(args.input, args.phonemes)
+
+    # Merge: inline > file > builtin (priority order)
+    phoneme_dict = {**BUILTIN_POLYPHONES, **file_phonemes, **inline_phonemes}
+    print(f"✓ 多音字词典: {len(phoneme_dict)} 条 (内置{len(BUILTIN_POLYPHONES)} + 文件{len(file_phonemes)} + 内联{len(inline_phonemes)})")
+
+    if not sections:
+        sections = [{'name': 'main', 'first_text': '', 'text': clean_text, 'start_time': 0, 'end_time': None}]
+        print("提示: 未检测到章节标记 [SECTION:name]，将生成单一章节")
+    else:
+        print(f"检测到 {len(sections)} 个章节: {[s['name'] for s in sections]}")
+        for s in sections:
+            status = " (silent)" if s.get('is_silent') else ""
+            print(f"  {s['name']}: \"{s['first_text'][:20]}...\"{status}")
+
+    print(f"文本长度: {len(clean_text)} 字符")
+
+    chunks = build_chunks(sections, clean_text, backend, phoneme_dict, anchor_sections=args.watch)
+    sizes = [payload_size(backend, c, phoneme_dict, speech_rate) for c in chunks]
+    print(f"分成 {len(chunks)} 段 (payload {min(sizes, default=0)}-{max(sizes, default=0)}"
+          f" / 上限 {payload_limit(backend, speech_rate)})")
+
+    # Dry-run: estimate duration and exit without calling TTS
+    if args.dry_run:
+        print_dry_run(clean_text, sections, speech_rate, backend)
+        return None
+
+    # TTS synthesis
+    part_files, word_boundaries, total_duration, synthesized = synthesize(
+        chunks, phoneme_dict, backend, speech_rate, args.output_dir, reuse=reuse, hedge=args.hedge,
+        progress=progress)
+    print(f"\n✓ 收集到 {len(word_boundaries)} 个词边界")
+    print(f"✓ 总时长: {total_duration:.1f} 秒")
+
+    align_sections(sections, word_boundaries, total_duration)
+
+    # 合并音频
+    print("\n合并音频...")
+    output_wav = concat_parts(part_files, args.output_dir)
+    print(f"✓ 完成: {output_wav}")
+
+    print("\n生成字幕...")
+    srt_lines = build_srt(word_boundaries)
+    output_srt = os.path.join(args.output_dir, "podcast_audio.srt")
+    atomic_write(output_srt, ''.join(srt_lines))
+    print(f"✓ 字幕: {output_srt} ({len(srt_lines)} 条)")
+
+    timing_data = build_timing(sections, total_duration, speech_rate)
+    output_timing = os.path.join(args.output_dir, "timing.json")
+    atomic_write(output_timing, json.dumps(timing_data, indent=2, ensure_ascii=False))
+
+    print(f"\n✓ 时间轴: {output_timing}")
+    print("\n章节时间:")
+    for s in timing_data['sections']:
+        print(f"  {s['name']}: {s['start_time']:.1f}s - {s['end_time']:.1f}s ({s['duration']:.1f}s)")
+
+    print(f"\n总时长: {total_duration:.1f}s ({timing_data['total_frames']} frames @ 30fps)")
+
+    if args.public_dir:
+        publish_outputs(args.output_dir, args.public_dir)
+
+    # --watch always needs the current chunks for the next save
+    policy = "used" if args.watch and args.keep_cache == "none" else args.keep_cache
+    prune_cache(args.output_dir, part_files, policy)
+
+    return {
+        'chunks': len(chunks),
+        'synthesized': synthesized,
+        'total_duration': total_duration,
+    }
+
+
+# ============ Watch 模式 ============
+def watched_paths(args):
+    """podcast.txt plus every phonemes.json location load_phoneme_dict searches"""
+    paths = [args.input]
+    if args.phonemes:
+        paths.append(args.phonemes)
+    paths.append(os.path.join(os.path.dirname(args.input), 'phonemes.json'))
+    paths.append(os.path.expanduser('~/.config/video-podcast-maker/phonemes.json'))
+    return paths
+
+
+def snapshot_mtimes(paths):
+    return tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in paths)
+
+
+def watch(args, backend, speech_rate):
+    """Regenerate on every save of podcast.txt/phonemes.json, reusing unchanged chunks"""
+    paths = watched_paths(args)
+    generate(args, backend, speech_rate, reuse=True)
+    last = snapshot_mtimes(paths)
+    print(f"\n👀 Watching {args.input} (debounce {args.debounce:.1f}s, Ctrl+C 退出)")
+
+    try:
+        while True:
+            time.sleep(0.2)
+            current = snapshot_mtimes(paths)
+            if current == last:
+                continue
+            # Debounce: wait until the files stop changing (editors often write twice)
+            while True:
+                time.sleep(args.debounce)
+                settled = snapshot_mtimes(paths)
+                if settled == current:
+                    break
+                current = settled
+            last = current
+            if current[0] is None:
+                # podcast.txt mid-save (delete + rename): wait for it to reappear
+                continue
+            edited_at = max(t for t in current if t is not None)
+
+            print("\n↻ 检测到修改，重新生成...")
+            try:
+                summary = generate(args, backend, speech_rate, reuse=True)
+            except Exception as e:
+                print(f"✗ 重新生成失败: {e}", file=sys.stderr)
+                continue
+            latency = time.time() - edited_at
+            print(f"⚡ 编辑→音频: {latency:.1f}s "
+                  f"(重新合成 {summary['synthesized']}/{summary['chunks']} 段)")
+    except KeyboardInterrupt:
+        print("\n已停止 watch")
+
+
+# ============ 常驻 Worker ============
+# Env vars that pick a voice/model; forwarded from the CLI so a handed-off job
+# sounds the same as a local run (credentials stay on the worker side)
+FORWARDED_ENV = ("EDGE_TTS_VOICE", "COSYVOICE_MODEL", "COSYVOICE_VOICE", "AZURE_SPEECH_REGION")
+DEFAULT_WORKER_PORT = 8765
+JOB_ARTIFACTS = OUTPUT_FILES
+# Shared secret of the running worker; readable only by the user who started it
+WORKER_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".tts_worker_token")
+WORKER_HOSTS = ("127.0.0.1", "localhost")
+MAX_FINISHED_JOBS = 50  # older finished jobs (and their logs) are forgotten
+
+
+def worker_url():
+    port = os.environ.get("TTS_WORKER_PORT", DEFAULT_WORKER_PORT)
+    return f"http://127.0.0.1:{port}"
+
+
+def write_worker_token():
+    """Generate a fresh worker token into WORKER_TOKEN_FILE (mode 600)"""
+    token = secrets.token_urlsafe(32)
+    fd = os.open(WORKER_TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    os.chmod(WORKER_TOKEN_FILE, 0o600)  # O_CREAT mode doesn't apply to an existing file
+    return token
+
+
+def read_worker_token():
+    try:
+        with open(WORKER_TOKEN_FILE, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class FairQueue:
+    """Job queue that round-robins across episodes (one output dir = one episode)
+
+    At most one job per episode runs at a time, so jobs never race on the same
+    output files, and a busy episode can't starve the others.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.episodes = OrderedDict()  # episode -> deque of queued jobs
+        self.running = set()
+        self.last_served = {}  # episode -> serve counter
+        self.served = 0
+
+    def put(self, job):
+        with self.cond:
+            self.episodes.setdefault(job['episode'], deque()).append(job)
+            self.cond.notify_all()
+
+    def get(self):
+        with self.cond:
+            while True:
+                ready = [ep for ep, jobs in self.episodes.items() if ep not in self.running]
+                if ready:
+                    # Least recently served episode goes first
+                    episode = min(ready, key=lambda ep: self.last_served.get(ep, -1))
+                    jobs = self.episodes[episode]
+                    job = jobs.popleft()
+                    if not jobs:
+                        del self.episodes[episode]
+                    self.served += 1
+                    self.last_served[episode] = self.served
+                    self.running.add(episode)
+                    return job
+                self.cond.wait()
+
+    def done(self, job):
+        with self.cond:
+            self.running.discard(job['episode'])
+            self.cond.notify_all()
+
+
+class JobLog:
+    """stdout replacement that records a job's output and echoes it to the worker console"""
+
+    def __init__(self, job, console):
+        self.job = job
+        self.console = console
+        self.partial = ""
+
+    def write(self, data):
+        self.console.write(data)
+        self.partial += data
+        *lines, self.partial = self.partial.split("\n")
+        self.job['log'].extend(lines)
+        return len(data)
+
+    def flush(self):
+        self.console.flush()
+
+
+class TTSWorker:
+    """Long-running TTS worker: warm SDKs, phoneme tables and chunk cache, local job API"""
+
+    def __init__(self, token):
+        self.token = token
+        self.jobs = {}  # id -> job, in submission order
+        self.jobs_lock = threading.Lock()
+        self.queue = FairQueue()
+        self.ready_backends = set()
+
+    def submit(self, request):
+        """Validate and queue a job request; returns (job, error)"""
+        backend = request.get('backend') or os.environ.get("TTS_BACKEND", "azure")
+        if backend not in self.ready_backends:
+            error = backend_error(backend)
+            if error:
+                return None, error
+            self.ready_backends.add(backend)
+        input_file = request.get('input')
+        if not input_file or not os.path.exists(input_file):
+            return None, f"Input file not found: {input_file}"
+
+        output_dir = os.path.abspath(request.get('output_dir') or os.path.dirname(input_file))
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'episode': output_dir,
+            'status': 'queued',
+            'backend': backend,
+            'speech_rate': request.get('speech_rate') or os.environ.get("TTS_RATE", "+5%"),
+            'args': argparse.Namespace(
+                input=input_file,
+                output_dir=output_dir,
+                phonemes=request.get('phonemes'),
+                public_dir=request.get('public_dir'),
+                resume=bool(request.get('resume')),
+                hedge=bool(request.get('hedge')),
+                keep_cache=request.get('keep_cache') if request.get('keep_cache') in CACHE_POLICIES else "used",
+                dry_run=False,
+                watch=False,
+            ),
+            'env': {k: v for k, v in (request.get('env') or {}).items() if k in FORWARDED_ENV},
+            'progress': {'done': 0, 'total': None},
+            'log': [],
+            'summary': None,
+            'error': None,
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
         }
-        for s in sections
-    ]
-}
+        with self.jobs_lock:
+            self.jobs[job['id']] = job
+        self.queue.put(job)
+        return job, None
+
+    def list_jobs(self):
+        with self.jobs_lock:
+            return list(self.jobs.values())
+
+    def prune_jobs(self):
+        """Drop the oldest finished jobs beyond MAX_FINISHED_JOBS"""
+        with self.jobs_lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job['finished'] is not None]
+            for job_id in finished[:-MAX_FINISHED_JOBS]:
+                del self.jobs[job_id]
+
+    def run_forever(self):
+        console = sys.stdout
+        while True:
+            job = self.queue.get()
+            job['status'] = 'running'
+            job['started'] = time.time()
+            # Run with exactly the client's settings: forwarded keys it didn't send are unset
+            saved_env = {k: os.environ.get(k) for k in FORWARDED_ENV}
+            for k in FORWARDED_ENV:
+                if k in job['env']:
+                    os.environ[k] = job['env'][k]
+                else:
+                    os.environ.pop(k, None)
+
+            def progress(done, total):
+                job['progress'] = {'done': done, 'total': total}
+
+            try:
+                with contextlib.redirect_stdout(JobLog(job, console)):
+                    print(f"=== Job {job['id']}: {job['args'].input} ({job['backend']}) ===")
+                    os.makedirs(job['args'].output_dir, exist_ok=True)
+                    job['summary'] = generate(job['args'], job['backend'], job['speech_rate'],
+                                              reuse=job['args'].resume, progress=progress)
+                job['status'] = 'done'
+            except (Exception, SystemExit) as e:
+                job['status'] = 'failed'
+                job['error'] = str(e)
+                job['log'].append(f"✗ {e}")
+            finally:
+                for k, v in saved_env.items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+                job['finished'] = time.time()
+                self.queue.done(job)
+                self.prune_jobs()
+
+    def job_status(self, job, since=0):
+        return {
+            'id': job['id'],
+            'episode': job['episode'],
+            'status': job['status'],
+            'backend': job['backend'],
+            'progress': job['progress'],
+            'summary': job['summary'],
+            'error': job['error'],
+            'log': job['log'][since:],
+            'log_offset': len(job['log']),
+            'artifacts': [name for name in JOB_ARTIFACTS
+                          if os.path.exists(os.path.join(job['episode'], name))],
+        }
+
+
+class WorkerHandler(BaseHTTPRequestHandler):
+    """Job API:
+    POST /jobs                          submit {input, output_dir, phonemes, backend, speech_rate, ...}
+    GET  /jobs                          list jobs
+    GET  /jobs/<id>?since=N             status, progress and log lines from N
+    GET  /jobs/<id>/artifacts/<name>    download podcast_audio.wav / .srt / timing.json
+    GET  /health
 
-output_timing = os.path.join(args.output_dir, "timing.json")
-with open(output_timing, "w", encoding="utf-8") as f:
-    json.dump(timing_data, f, indent=2, ensure_ascii=False)
+    Every request needs "Authorization: Bearer <token from WORKER_TOKEN_FILE>" and a
+    127.0.0.1/localhost Host header; POST bodies must be application/json. A web page
+    can't read the token, so it can't queue paid jobs via CSRF or DNS rebinding.
+    """
+    worker = None
+
+    def rejected(self, post=False):
+        """(status, message) if the request must be refused, else None"""
+        host = (self.headers.get('Host') or '').rsplit(':', 1)[0]
+        if host not in WORKER_HOSTS:
+            return 403, f"bad Host: {host}"
+        token = (self.headers.get('Authorization') or '').encode('utf-8')
+        if not hmac.compare_digest(token, f"Bearer {self.worker.token}".encode('utf-8')):
+            return 401, "missing or wrong worker token"
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip()
+        if post and content_type != 'application/json':
+            return 415, "Content-Type must be application/json"
+        return None
+
+    def send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        rejected = self.rejected()
+        if rejected:
+            return self.send_json(rejected[0], {'error': rejected[1]})
+        path, _, query = self.path.partition('?')
+        parts = [p for p in path.split('/') if p]
+        if parts == ['health']:
+            return self.send_json(200, {'status': 'ok', 'jobs': len(self.worker.jobs)})
+        if parts == ['jobs']:
+            return self.send_json(200, [self.worker.job_status(j, len(j['log'])) for j in self.worker.list_jobs()])
+        job = self.worker.jobs.get(parts[1]) if len(parts) >= 2 and parts[0] == 'jobs' else None
+        if job is None:
+            return self.send_json(404, {'error': 'not found'})
+        if len(parts) == 2:
+            since = re.search(r'since=(\d+)', query)
+            return self.send_json(200, self.worker.job_status(job, int(since.group(1)) if since else 0))
+        if len(parts) == 4 and parts[2] == 'artifacts' and parts[3] in JOB_ARTIFACTS:
+            artifact = os.path.join(job['episode'], parts[3])
+            if job['status'] == 'done' and os.path.exists(artifact):
+                # Stream from disk: podcast_audio.wav can be hundreds of MB
+                with open(artifact, 'rb') as f:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/octet-stream')
+                    self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+                    self.end_headers()
+                    shutil.copyfileobj(f, self.wfile)
+                return
+        return self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        rejected = self.rejected(post=True)
+        if rejected:
+            return self.send_json(rejected[0], {'error': rejected[1]})
+        if self.path.rstrip('/') != '/jobs':
+            return self.send_json(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            return self.send_json(400, {'error': f"invalid JSON: {e}"})
+        job, error = self.worker.submit(request)
+        if error:
+            return self.send_json(400, {'error': error})
+        return self.send_json(202, {'id': job['id'], 'status': job['status']})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    """Run the TTS worker on 127.0.0.1:port until interrupted"""
+    worker = TTSWorker(write_worker_token())
+    WorkerHandler.worker = worker
+    server = ThreadingHTTPServer(("127.0.0.1", port), WorkerHandler)
+    threading.Thread(target=worker.run_forever, daemon=True).start()
+    print(f"✓ TTS worker listening on http://127.0.0.1:{port} (token: {WORKER_TOKEN_FILE}, Ctrl+C 退出)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n已停止 worker")
+    finally:
+        server.server_close()
+
+
+def worker_request(method, path, data=None, timeout=5):
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    req = urllib.request.Request(worker_url() + path, data=body, method=method, headers={
+        'Content-Type': 'application/json',
+        'Authorization': f"Bearer {read_worker_token()}",
+    })
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read())
+
+
+def worker_available():
+    try:
+        return worker_request('GET', '/health', timeout=0.3).get('status') == 'ok'
+    except (OSError, ValueError):
+        return False
+
+
+def hand_off(args, backend, speech_rate):
+    """Submit this run to a running worker and stream its log
+
+    Returns the exit code, or None if the worker didn't take the job (e.g. it
+    lacks this backend's API key or SDK) and the run should happen locally.
+    """
+    request = {
+        'input': os.path.abspath(args.input),
+        'output_dir': os.path.abspath(args.output_dir),
+        'phonemes': os.path.abspath(args.phonemes) if args.phonemes else None,
+        'public_dir': os.path.abspath(args.public_dir) if args.public_dir else None,
+        'backend': backend,
+        'speech_rate': speech_rate,
+        'resume': args.resume,
+        'hedge': args.hedge,
+        'keep_cache': args.keep_cache,
+        'env': {k: os.environ[k] for k in FORWARDED_ENV if k in os.environ},
+    }
+    try:
+        job = worker_request('POST', '/jobs', request)
+    except (OSError, ValueError) as e:
+        job = {'error': str(e)}
+    if 'id' not in job:
+        print(f"⚠ TTS worker 未接受任务 ({job.get('error')})，改为本地合成")
+        return None
+    print(f"→ 已提交到 TTS worker ({worker_url()}), job {job['id']}")
+
+    offset = 0
+    while True:
+        try:
+            status = worker_request('GET', f"/jobs/{job['id']}?since={offset}")
+        except (OSError, ValueError) as e:
+            print(f"Error: lost connection to TTS worker ({e}); job {job['id']} did not finish", file=sys.stderr)
+            return 1
+        if 'status' not in status:
+            print(f"Error: TTS worker lost job {job['id']} ({status.get('error')})", file=sys.stderr)
+            return 1
+        for line in status['log']:
+            print(line)
+        offset = status['log_offset']
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.5)
+    if status['status'] == 'failed':
+        print(f"Error: {status['error']}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate TTS audio from podcast script',
+        epilog='Backends: azure (default), cosyvoice, edge (free). Env: TTS_BACKEND, AZURE_SPEECH_KEY, DASHSCOPE_API_KEY, EDGE_TTS_VOICE, TTS_RATE'
+    )
+    parser.add_argument('--input', '-i', default='podcast.txt', help='Input script file (default: podcast.txt)')
+    parser.add_argument('--output-dir', '-o', default='.', help='Output directory for podcast_audio.wav, podcast_audio.srt, timing.json (default: current dir)')
+    parser.add_argument('--phonemes', '-p', default=None, help='Phoneme dictionary JSON file (default: phonemes.json in input dir)')
+    parser.add_argument('--backend', '-b', default=None,
+        help='TTS backend: azure, cosyvoice, or edge (default: env TTS_BACKEND or azure)')
+    parser.add_argument('--resume', action='store_true',
+        help='Resume from last breakpoint, skip already synthesized parts')
+    parser.add_argument('--dry-run', action='store_true',
+        help='Parse sections and estimate duration without calling TTS API')
+    parser.add_argument('--watch', action='store_true',
+        help='Stay running and regenerate on every save, re-synthesizing only changed chunks')
+    parser.add_argument('--debounce', type=float, default=0.5,
+        help='Watch mode: seconds the input must stay unchanged before regenerating (default: 0.5)')
+    parser.add_argument('--hedge', action='store_true',
+        help='Send a duplicate request for chunks running past the p95 latency; first result wins')
+    parser.add_argument('--public-dir', default=None,
+        help='Also publish podcast_audio.wav/.srt and timing.json into this dir, e.g. public (default: off)')
+    parser.add_argument('--keep-cache', choices=CACHE_POLICIES, default="used",
+        help='Chunk cache after a successful run: used = only chunks of this output (default, '
+             'enough for --resume/--watch), all = keep every version, none = delete')
+    parser.add_argument('--serve', action='store_true',
+        help='Run as a long-lived local TTS worker; other invocations hand their jobs to it')
+    parser.add_argument('--port', type=int, default=None,
+        help=f'Worker port on 127.0.0.1 (default: env TTS_WORKER_PORT or {DEFAULT_WORKER_PORT})')
+    parser.add_argument('--no-worker', action='store_true',
+        help='Always synthesize in this process, even if a worker is running')
+
+    args = parser.parse_args()
+
+    if args.port:
+        os.environ["TTS_WORKER_PORT"] = str(args.port)
+    if args.serve:
+        serve(int(os.environ.get("TTS_WORKER_PORT", DEFAULT_WORKER_PORT)))
+        return
+
+    backend = args.backend or os.environ.get("TTS_BACKEND", "azure")
+    print(f"TTS backend: {backend}")
+
+    # Speech rate: -50% ~ +200%, or x-slow/slow/medium/fast/x-fast
+    speech_rate = os.environ.get("TTS_RATE", "+5%")
+
+    # Hand off to a running worker (warm SDKs/caches); watch and dry-run stay local
+    if not (args.no_worker or args.watch or args.dry_run) and worker_available():
+        if not os.path.exists(args.input):
+            print(f"Error: Input file not found: {args.input}", file=sys.stderr)
+            sys.exit(1)
+        code = hand_off(args, backend, speech_rate)
+        if code is not None:
+            sys.exit(code)
+
+    check_backend(backend)
+
+    # Ensure output directory exists
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if not os.path.exists(args.input):
+        print(f"Error: Input file not found: {args.input}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.watch and not args.dry_run:
+        watch(args, backend, speech_rate)
+    else:
+        generate(args, backend, speech_rate, reuse=args.resume)
 
-print(f"\n✓ 时间轴: {output_timing}")
-print("\n章节时间:")
-for s in timing_data['sections']:
-    print(f"  {s['name']}: {s['start_time']:.1f}s - {s['end_time']:.1f}s ({s['duration']:.1f}s)")
 
-print(f"\n总时长: {total_duration:.1f}s ({timing_data['total_frames']} frames @ 30fps)")
+if __name__ == '__main__':
+    main()
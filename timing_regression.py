@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Timing / subtitle regression harness for generate_tts.py
+Replays a recorded word-boundary stream (no network, no TTS) through section
+alignment, silent-section handling, SRT segmentation and timing.json, then
+scores section sync accuracy against the reference timing.json the stream
+belongs to, flags any change against the golden outputs, and times each stage.
+Also checks that watch-mode chunking stays near the fewest chunks and only
+re-synthesizes around a sentence edit.
+
+Fixture layout (default: examples/video-podcast-maker-v2/):
+    podcast.txt                        script (sections, labels, first_text)
+    timing.json                        reference timing (ground truth for accuracy)
+    regression/word_boundaries.json    recorded stream: {source, total_duration, words}
+    regression/timing.json             golden timing.json (change detector, --update)
+    regression/podcast_audio.srt       golden subtitles (change detector, --update)
+"""
+import os
+import io
+import re
+import sys
+import copy
+import json
+import time
+import argparse
+import contextlib
+import statistics
+
+import generate_tts as tts
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'examples', 'video-podcast-maker-v2')
+
+
+def fixture_paths(fixture):
+    reg = os.path.join(fixture, 'regression')
+    return {
+        'script': os.path.join(fixture, 'podcast.txt'),
+        'reference_timing': os.path.join(fixture, 'timing.json'),
+        'words': os.path.join(reg, 'word_boundaries.json'),
+        'timing': os.path.join(reg, 'timing.json'),
+        'srt': os.path.join(reg, 'podcast_audio.srt'),
+    }
+
+
+def load_sections(script_file):
+    """Sections exactly as generate() builds them before alignment"""
+    with open(script_file, 'r', encoding='utf-8') as f:
+        text = f.read().strip()
+    sections, clean_text, _ = tts.parse_script(text)
+    if not sections:
+        sections = [{'name': 'main', 'first_text': '', 'text': clean_text, 'start_time': 0, 'end_time': None}]
+    return sections
+
+
+# ============ Fixture capture ============
+TOKEN_PATTERN = r'[A-Za-z][A-Za-z0-9\-\.]*[A-Za-z0-9]|[A-Za-z]|\d+|[\u4e00-\u9fff]|\S'
+SPOKEN_PATTERN = r'[A-Za-z0-9\u4e00-\u9fff]'
+
+
+def derive_stream(sections, reference):
+    """Build a word-boundary stream consistent with an existing timing.json
+
+    Each section's spoken tokens (CJK chars, English words, numbers) are spread
+    evenly over that section's [start_time, end_time]; punctuation is zero-length
+    at the end of the previous token, as Azure reports it. Used to seed a fixture
+    when no recorded stream is available, so section accuracy measured on it is
+    only as good as this model of the real stream.
+    """
+    ref = {s['name']: s for s in reference['sections']}
+    # Audio ends with the last section that has narration in the script
+    audio_end = max((ref[s['name']]['end_time'] for s in sections if not s.get('is_silent')),
+                    default=reference['total_duration'])
+    words = []
+    for section in sections:
+        tokens = re.findall(TOKEN_PATTERN, section['text'])
+        if not tokens:
+            continue
+        start, end = ref[section['name']]['start_time'], ref[section['name']]['end_time']
+        spoken = [t for t in tokens if re.match(SPOKEN_PATTERN, t)]
+        slot = (end - start) / max(len(spoken), 1)
+        k, prev_end = 0, start
+        for token in tokens:
+            if re.match(SPOKEN_PATTERN, token):
+                offset, duration = start + k * slot, slot * 0.9
+                k += 1
+                prev_end = offset + duration
+            else:
+                offset, duration = prev_end, 0
+            words.append({
+                'text': token,
+                'offset': round(offset, 4),
+                'duration': round(duration, 4),
+            })
+    return {'source': 'derived from timing.json', 'total_duration': audio_end, 'words': words}
+
+
+def record_stream(output_dir):
+    """Rebuild the global word-boundary stream of a real run from its chunk cache
+
+    Chunk order comes from the cache manifest; the run must have kept its chunk
+    metadata (--keep-cache used or all).
+    """
+    cache_dir = os.path.join(output_dir, tts.CACHE_DIR)
+    with open(os.path.join(cache_dir, tts.CACHE_MANIFEST), 'r', encoding='utf-8') as f:
+        parts = json.load(f)['parts']
+    words, offset = [], 0
+    for part in parts:
+        meta_file = os.path.join(cache_dir, os.path.splitext(part)[0] + '.json')
+        if not os.path.exists(meta_file):
+            raise FileNotFoundError(f"{meta_file} missing (run was pruned with --keep-cache none?)")
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        words.extend({**w, 'offset': offset + w['offset']} for w in meta['words'])
+        offset += meta['duration']
+    return {'source': f'recorded from {output_dir}', 'total_duration': offset, 'words': words}
+
+
+# ============ Replay ============
+def replay(sections, stream, speech_rate='+5%'):
+    """Run the post-synthesis pipeline once; returns (timing_data, srt_lines, stage_seconds)"""
+    sections = copy.deepcopy(sections)
+    words, total = stream['words'], stream['total_duration']
+    stages = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        t = time.perf_counter()
+        tts.align_sections(sections, words, total)
+        stages['align_sections'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        srt_lines = tts.build_srt(words)
+        stages['build_srt'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        timing = tts.build_timing(sections, total, speech_rate)
+        stages['build_timing'] = time.perf_counter() - t
+    return timing, srt_lines, stages
+
+
+def parse_srt(text):
+    cues = []
+    for block in re.split(r'\n\s*\n', text.strip()):
+        lines = block.strip().split('\n')
+        if len(lines) < 3:
+            continue
+        m = re.match(r'(\d+):(\d+):(\d+),(\d+) --> (\d+):(\d+):(\d+),(\d+)', lines[1])
+        if not m:
+            continue
+        v = [int(x) for x in m.groups()]
+        start = v[0] * 3600 + v[1] * 60 + v[2] + v[3] / 1000
+        end = v[4] * 3600 + v[5] * 60 + v[6] + v[7] / 1000
+        cues.append({'start': start, 'end': end, 'text': '\n'.join(lines[2:])})
+    return cues
+
+
+def distribution(values):
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(statistics.mean(values), 3),
+        'p50': round(tts.percentile(values, 50), 3),
+        'p95': round(tts.percentile(values, 95), 3),
+        'max': round(max(values), 3),
+    }
+
+
+def score_sections(timing, golden, names=None):
+    """Per-section frame error against a golden/reference timing.json (only names, if given)"""
+    golden_by_name = {s['name']: s for s in golden['sections'] if names is None or s['name'] in names}
+    rows = []
+    for s in timing['sections']:
+        if names is not None and s['name'] not in names:
+            continue
+        g = golden_by_name.get(s['name'])
+        if g is None:
+            rows.append({'name': s['name'], 'start_error': None, 'duration_error': None})
+            continue
+        rows.append({
+            'name': s['name'],
+            'start_frame': s['start_frame'],
+            'start_error': s['start_frame'] - g['start_frame'],
+            'duration_error': s['duration_frames'] - g['duration_frames'],
+        })
+    missing = [name for name in golden_by_name if name not in {s['name'] for s in timing['sections']}]
+    return rows, missing
+
+
+def section_bias(rows):
+    """Mean start error (frames) of the sections after the first; negative = cuts come early"""
+    errors = [row['start_error'] for row in rows[1:] if row['start_error'] is not None]
+    return round(statistics.mean(errors), 2) if errors else 0
+
+
+def score_srt(cues, golden_cues):
+    """Cue boundary error (ms) and text mismatches against the golden SRT"""
+    boundary_errors = []
+    text_mismatches = 0
+    for cue, gold in zip(cues, golden_cues):
+        boundary_errors.append(abs(cue['start'] - gold['start']) * 1000)
+        boundary_errors.append(abs(cue['end'] - gold['end']) * 1000)
+        if cue['text'] != gold['text']:
+            text_mismatches += 1
+    return {
+        'cues': len(cues),
+        'golden_cues': len(golden_cues),
+        'max_boundary_error_ms': round(max(boundary_errors, default=0), 3),
+        'text_mismatches': text_mismatches + abs(len(cues) - len(golden_cues)),
+        'chars': distribution([len(c['text']) for c in cues]),
+        'golden_chars': distribution([len(c['text']) for c in golden_cues]),
+        'seconds': distribution([c['end'] - c['start'] for c in cues]),
+        'golden_seconds': distribution([c['end'] - c['start'] for c in golden_cues]),
+    }
+
+
+def check_fallback(sections, stream):
+    """Replay with no word boundaries: proportional estimation must still be a valid timeline"""
+    timing, _, _ = replay(sections, {'words': [], 'total_duration': stream['total_duration']})
+    problems = []
+    prev_end = 0
+    for s in timing['sections']:
+        if s['start_time'] < prev_end - 1e-6 and not s['is_silent']:
+            problems.append(f"{s['name']} starts before previous section ends")
+        if s['end_time'] > timing['total_duration'] + 1e-6:
+            problems.append(f"{s['name']} ends after audio end")
+        prev_end = s['end_time']
+    return problems
+
+
+def check_chunk_stability(sections, backends=('azure', 'cosyvoice', 'edge')):
+    """Watch-mode chunking must stay close to the fewest round trips and be stable under edits
+
+    Chunk count may exceed pack_chunks by at most max(2, count // 4). Editing any
+    sentence may re-synthesize the chunk containing it plus at most one neighbour
+    whose shared boundary moved (one more if the edit pushes the chunk over budget);
+    every other chunk must be reused. Runs on the fixture's sections and on the
+    whole script as one long section, which is where re-balancing used to shift
+    every later boundary.
+    Returns ({backend: number of edits checked}, problems).
+    """
+    clean_text = '\n\n'.join(s['text'] for s in sections)
+    layouts = [sections, [{'name': 'all', 'text': clean_text}]]
+    checked, problems = {}, []
+    for backend in backends:
+        checked[backend] = 0
+        for layout in layouts:
+            base = tts.build_chunks(layout, clean_text, backend, tts.BUILTIN_POLYPHONES, anchor_sections=True)
+            packed = sum(len(tts.pack_chunks(s['text'], backend, tts.BUILTIN_POLYPHONES)) for s in layout)
+            if len(base) > packed + max(2, packed // 4):
+                problems.append(f"{backend}: {len(base)} anchored chunks vs {packed} packed")
+            for i, section in enumerate(layout):
+                for sentence in re.findall(tts.SENTENCE_PATTERN, section['text'], re.S):
+                    sentence = sentence.strip()
+                    if len(sentence) < 8:
+                        continue
+                    replacement = sentence[:6] + '，这一点非常重要，值得反复强调，' + sentence[6:]
+                    edited = copy.deepcopy(layout)
+                    edited[i]['text'] = section['text'].replace(sentence, replacement, 1)
+                    chunks = tts.build_chunks(edited, clean_text, backend, tts.BUILTIN_POLYPHONES,
+                                              anchor_sections=True)
+                    # A sentence split into clauses may span chunks; they all count as home
+                    home = [k for k, c in enumerate(base) if sentence in c]
+                    near = {k + d for k in home for d in (-1, 0, 1)}
+                    lost = [c for k, c in enumerate(base) if k not in near and c not in chunks]
+                    changed = len(set(chunks) - set(base))
+                    fits = len(home) == 1 and tts.payload_cost(
+                        backend, base[home[0]].replace(sentence, replacement, 1),
+                        tts.BUILTIN_POLYPHONES) <= tts.CHUNK_LIMITS[backend]
+                    checked[backend] += 1
+                    if lost or changed > (2 if fits else 3):
+                        problems.append(f"{backend}: editing '{sentence[:12]}…' re-synthesizes {changed} chunks")
+    return checked, problems
+
+
+def time_stages(sections, stream, repeat):
+    samples = {}
+    for _ in range(repeat):
+        for stage, seconds in replay(sections, stream)[2].items():
+            samples.setdefault(stage, []).append(seconds * 1000)
+    return {stage: {'min_ms': round(min(v), 3), 'median_ms': round(statistics.median(v), 3)}
+            for stage, v in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay recorded word boundaries through alignment/SRT/timing and score accuracy + speed')
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE,
+        help='Fixture dir with podcast.txt and regression/ (default: examples/video-podcast-maker-v2)')
+    parser.add_argument('--repeat', type=int, default=20, help='Timing iterations per stage (default: 20)')
+    parser.add_argument('--max-frame-error', type=int, default=1,
+        help='Allowed |frame error| per section against the reference timing.json (default: 1)')
+    parser.add_argument('--max-drift-frames', type=int, default=0,
+        help='Allowed per-section change against the golden regression/timing.json (default: 0)')
+    parser.add_argument('--max-cue-error-ms', type=float, default=1.0,
+        help='Allowed SRT cue boundary error in ms (default: 1)')
+    parser.add_argument('--json', default=None, help='Also write the full report to this JSON file')
+    parser.add_argument('--update', action='store_true',
+        help='Accept current output as golden (rewrite regression/timing.json and .srt)')
+    parser.add_argument('--derive', action='store_true',
+        help="Rebuild regression/word_boundaries.json from the fixture's timing.json")
+    parser.add_argument('--record-from', default=None, metavar='OUTPUT_DIR',
+        help='Rebuild regression/word_boundaries.json from a real run (needs its .tts_cache)')
+    args = parser.parse_args()
+
+    paths = fixture_paths(args.fixture)
+    sections = load_sections(paths['script'])
+
+    if args.derive or args.record_from:
+        if args.record_from:
+            try:
+                stream = record_stream(args.record_from)
+            except FileNotFoundError as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+        else:
+            with open(paths['reference_timing'], 'r', encoding='utf-8') as f:
+                stream = derive_stream(sections, json.load(f))
+        os.makedirs(os.path.dirname(paths['words']), exist_ok=True)
+        tts.atomic_write(paths['words'], json.dumps(stream, ensure_ascii=False, indent=1))
+        print(f"✓ 词边界: {paths['words']} ({len(stream['words'])} 个, {stream['source']})")
+        return
+
+    with open(paths['words'], 'r', encoding='utf-8') as f:
+        stream = json.load(f)
+    timing, srt_lines, _ = replay(sections, stream)
+
+    if args.update:
+        tts.atomic_write(paths['timing'], json.dumps(timing, indent=2, ensure_ascii=False))
+        tts.atomic_write(paths['srt'], ''.join(srt_lines))
+        print(f"✓ 已更新 golden: {paths['timing']}, {paths['srt']}")
+        return
+
+    with open(paths['timing'], 'r', encoding='utf-8') as f:
+        golden_timing = json.load(f)
+    with open(paths['srt'], 'r', encoding='utf-8') as f:
+        golden_cues = parse_srt(f.read())
+
+    with open(paths['reference_timing'], 'r', encoding='utf-8') as f:
+        reference_timing = json.load(f)
+
+    # Accuracy: only narrated sections are in the stream (the reference may have trailing music)
+    narrated = {s['name'] for s in sections if not s.get('is_silent')}
+    section_rows, missing = score_sections(timing, reference_timing, narrated)
+    bias = section_bias(section_rows)
+    drift_rows, drift_missing = score_sections(timing, golden_timing)
+    drifted = [row for row in drift_rows if row['start_error'] is None
+               or max(abs(row['start_error']), abs(row['duration_error'])) > args.max_drift_frames]
+    srt_score = score_srt(parse_srt(''.join(srt_lines)), golden_cues)
+    fallback_problems = check_fallback(sections, stream)
+    stability_checked, stability_problems = check_chunk_stability(sections)
+    stages = time_stages(sections, stream, args.repeat)
+
+    print(f"Fixture: {args.fixture} ({len(stream['words'])} words, {stream['source']})")
+    print(f"\n章节帧误差 (vs {paths['reference_timing']}):")
+    for row in section_rows:
+        print(f"  {row['name']:<12} start {row['start_error']:+d}  duration {row['duration_error']:+d} frames"
+              if row['start_error'] is not None else f"  {row['name']:<12} (not in reference)")
+    fps = reference_timing.get('fps', 30)
+    print(f"  {'⚠' if abs(bias) >= 1 else '✓'} 平均起点偏差: {bias:+.2f} frames ({bias / fps:+.3f}s)")
+    print(f"\n变更检测 (vs {paths['timing']}): {len(drifted)} section(s) changed")
+    for row in drifted:
+        print(f"  {row['name']:<12} start {row['start_error']:+d}  duration {row['duration_error']:+d} frames"
+              if row['start_error'] is not None else f"  {row['name']:<12} (not in golden)")
+    print(f"\n字幕: {srt_score['cues']} cues (golden {srt_score['golden_cues']}), "
+          f"max boundary error {srt_score['max_boundary_error_ms']}ms, text mismatches {srt_score['text_mismatches']}")
+    print(f"  chars   {srt_score['chars']}")
+    print(f"  seconds {srt_score['seconds']}")
+    print("\n分段稳定性: " + ", ".join(f"{b} {n} edits" for b, n in stability_checked.items())
+          + f", {len(stability_problems)} problem(s)")
+    print("\n耗时:")
+    for stage, t in stages.items():
+        print(f"  {stage:<15} min {t['min_ms']:.3f}ms  median {t['median_ms']:.3f}ms")
+
+    failures = []
+    for row in section_rows:
+        if row['start_error'] is None:
+            failures.append(f"section {row['name']} not in reference")
+        elif max(abs(row['start_error']), abs(row['duration_error'])) > args.max_frame_error:
+            failures.append(f"section {row['name']} off by {row['start_error']:+d}/{row['duration_error']:+d} frames")
+    failures += [f"reference section {name} missing" for name in missing]
+    failures += [f"section {row['name']} changed vs golden" for row in drifted]
+    failures += [f"golden section {name} missing" for name in drift_missing]
+    if srt_score['max_boundary_error_ms'] > args.max_cue_error_ms:
+        failures.append(f"SRT cue boundary error {srt_score['max_boundary_error_ms']}ms")
+    if srt_score['text_mismatches']:
+        failures.append(f"{srt_score['text_mismatches']} SRT cue(s) differ")
+    failures += [f"fallback: {p}" for p in fallback_problems]
+    failures += [f"chunking: {p}" for p in stability_problems]
+
+    if args.json:
+        tts.atomic_write(args.json, json.dumps({
+            'fixture': args.fixture,
+            'sections': section_rows,
+            'bias_frames': bias,
+            'drift': drift_rows,
+            'srt': srt_score,
+            'chunk_stability': {'edits': stability_checked, 'problems': stability_problems},
+            'stages': stages,
+            'failures': failures,
+        }, indent=2, ensure_ascii=False))
+
+    if failures:
+        print("\n✗ 回归失败:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\n✓ 时间轴与字幕无回归")
+
+
+if __name__ == '__main__':
+    main()